@@ -75,6 +75,7 @@ class PagesMixin(ConfluenceClient):
                 confluence_client=self.confluence,
                 page_id=page_id,
                 preserve_inline_attachments=self.preprocessor.preserve_inline_attachments,
+                needs_markdown=convert_to_markdown,
             )
 
             # Use the appropriate content format based on the convert_to_markdown flag
@@ -194,6 +195,7 @@ class PagesMixin(ConfluenceClient):
                 confluence_client=self.confluence,
                 page_id=page.get("id"),
                 preserve_inline_attachments=self.preprocessor.preserve_inline_attachments,
+                needs_markdown=convert_to_markdown,
             )
 
             # Use the appropriate content format based on the convert_to_markdown flag
@@ -259,6 +261,7 @@ class PagesMixin(ConfluenceClient):
                 confluence_client=self.confluence,
                 page_id=page.get("id"),
                 preserve_inline_attachments=self.preprocessor.preserve_inline_attachments,
+                needs_markdown=convert_to_markdown,
             )
 
             # Use the appropriate content format based on the convert_to_markdown flag
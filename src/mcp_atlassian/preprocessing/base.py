@@ -1,15 +1,235 @@
 """Base preprocessing module."""
 
+import itertools
 import logging
 import re
+import threading
+import time
 import warnings
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from html.entities import name2codepoint
 from typing import Any, Protocol
+from urllib.parse import quote
 
-from bs4 import BeautifulSoup, Tag
-from markdownify import markdownify as md
+from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4.builder import LXMLTreeBuilderForXML, ParserRejectedMarkup
+from lxml import etree
+from markdownify import MarkdownConverter
 
 logger = logging.getLogger("mcp-atlassian")
 
+# Namespaces used by Confluence Storage Format macros (ac:*) and resource
+# identifiers (ri:*). Fragments are wrapped in an element declaring them so
+# they can be parsed as XML.
+STORAGE_FORMAT_ROOT = (
+    '<ac:confluence xmlns:ac="http://atlassian.com/content" '
+    'xmlns:ri="http://atlassian.com/resource/identifier">'
+)
+STORAGE_FORMAT_ROOT_END = "</ac:confluence>"
+
+# XML only predefines these five entities; other HTML named entities such as
+# &nbsp; must be rewritten as numeric character references. CDATA sections
+# are matched as a whole so entity-like text inside them is left untouched.
+_XML_ENTITIES = frozenset({"amp", "lt", "gt", "quot", "apos"})
+_NAMED_ENTITY_RE = re.compile(
+    r"<!\[CDATA\[.*?\]\]>|&([A-Za-z][A-Za-z0-9]*);", re.DOTALL
+)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _named_entity_to_numeric(match: re.Match[str]) -> str:
+    name = match.group(1)
+    if name is None or name in _XML_ENTITIES or name not in name2codepoint:
+        return match.group(0)
+    return f"&#{name2codepoint[name]};"
+
+
+# Percent-encoding table for ASCII text, matching urllib.parse.quote with its
+# default safe="/" argument.
+_ASCII_QUOTE_TABLE = str.maketrans(
+    {
+        code: chr(code)
+        if chr(code).isalnum() or chr(code) in "_.-~/"
+        else f"%{code:02X}"
+        for code in range(128)
+    }
+)
+
+
+_thread_local = threading.local()
+
+
+def _markdown_converter() -> MarkdownConverter:
+    """Get this thread's markdown converter, creating it on first use."""
+    converter = getattr(_thread_local, "markdown_converter", None)
+    if converter is None:
+        converter = MarkdownConverter()
+        _thread_local.markdown_converter = converter
+    return converter
+
+
+@lru_cache(maxsize=1024)
+def quote_attachment_filename(filename: str) -> str:
+    """URL encode an attachment filename; filenames often repeat on a page."""
+    if filename.isascii():
+        return filename.translate(_ASCII_QUOTE_TABLE)
+    return quote(filename)
+
+
+def _has_storage_format_elements(html_content: str) -> bool:
+    """Check whether content contains Confluence ac:/ri: elements."""
+    return "<ac:" in html_content or "<ri:" in html_content
+
+
+def has_attachment_references(html_content: str) -> bool:
+    """Check whether content references attachments that could be inlined."""
+    # Every rewritten ac:image/ac:link macro holds an ri:attachment
+    return "<ri:attachment" in html_content
+
+
+def _wrap_storage_format(html_content: str) -> str:
+    """Wrap a storage format fragment so it can be parsed as XML."""
+    xml_content = _NAMED_ENTITY_RE.sub(_named_entity_to_numeric, html_content)
+    return f"{STORAGE_FORMAT_ROOT}{xml_content}{STORAGE_FORMAT_ROOT_END}"
+
+
+_AC = "{http://atlassian.com/content}"
+_RI = "{http://atlassian.com/resource/identifier}"
+_ATTACHMENT_PLACEHOLDERS = {
+    f"{_AC}image": "[Image attachment]",
+    f"{_AC}link": "[Attachment link]",
+    f"{_RI}attachment": "[Attachment]",
+}
+
+
+def _element_text(element: etree._Element) -> str:
+    """Return the text of an element the way Tag.get_text(strip=True) does."""
+    return "".join(text.strip() for text in element.itertext())
+
+
+def _replace_element(
+    element: etree._Element, replacement: etree._Element | str
+) -> None:
+    """Replace an element with another element or plain text, keeping its tail."""
+    parent = element.getparent()
+    if parent is None:
+        return
+    tail = element.tail or ""
+    if isinstance(replacement, str):
+        text = replacement + tail
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + text
+        else:
+            parent.text = (parent.text or "") + text
+        parent.remove(element)
+    else:
+        replacement.tail = tail
+        parent.replace(element, replacement)
+
+
+def _rewrite_attachments_lxml(html_content: str, url_prefix: str) -> str | None:
+    """
+    Rewrite attachment macros in storage format directly on an lxml tree.
+
+    Replaces ac:image macros with <img> tags, and ac:link macros and plain
+    ri:attachment references with <a> tags, without building a
+    BeautifulSoup tree. The HTML5 parsers behind faster libraries such as
+    selectolax ignore the self-closing slash on unknown elements and nest
+    the following content inside <ri:attachment/>, so libxml2's XML parser
+    is used instead.
+
+    Args:
+        html_content: Storage format content to rewrite
+        url_prefix: Download URL prefix for the page's attachments
+
+    Returns:
+        The rewritten content, or None if the content is not well-formed XML
+    """
+    parser = etree.XMLParser(strip_cdata=False, recover=False)
+    try:
+        root = etree.fromstring(_wrap_storage_format(html_content), parser)
+    except etree.XMLSyntaxError as e:
+        logger.debug(f"Falling back to soup attachment processing: {e}")
+        return None
+
+    # Rewrite ac:image/ac:link macros first. Replacing a macro detaches the
+    # attachments inside it, so the plain ri:attachment pass below only sees
+    # nested attachments of macros that were left in place.
+    nested_attachments: set[etree._Element] = set()
+
+    def remaining_attachments() -> Iterator[etree._Element]:
+        for attachment in list(root.iter(f"{_RI}attachment")):
+            if attachment not in nested_attachments:
+                yield attachment
+
+    macros = list(root.iter(f"{_AC}image", f"{_AC}link"))
+    for element in itertools.chain(macros, remaining_attachments()):
+        try:
+            if element.tag == f"{_RI}attachment":
+                attachment_ref = element
+            else:
+                attachment_ref = element.find(f".//{_RI}attachment")
+                if attachment_ref is None:
+                    continue
+
+            filename = attachment_ref.get(f"{_RI}filename")
+            if not filename:
+                if element.tag != f"{_RI}attachment":
+                    nested_attachments.update(element.iter(f"{_RI}attachment"))
+                continue
+
+            if element.tag == f"{_AC}image":
+                alt_text = ""
+                for param in element.iter(f"{_AC}parameter"):
+                    if param.get(f"{_AC}name") in ["alt", "title", "caption"]:
+                        alt_text = _element_text(param)
+                        break
+                replacement = etree.Element(
+                    "img",
+                    src=url_prefix + quote_attachment_filename(filename),
+                    alt=alt_text or filename,
+                )
+            else:
+                link_text = filename
+                if element.tag == f"{_AC}link":
+                    link_body = element.find(f".//{_AC}link-body")
+                    if link_body is not None:
+                        link_text = _element_text(link_body)
+                replacement = etree.Element(
+                    "a", href=url_prefix + quote_attachment_filename(filename)
+                )
+                replacement.text = link_text
+
+            _replace_element(element, replacement)
+
+        except Exception as e:
+            logger.warning(f"Error processing attachment macro: {str(e)}")
+            _replace_element(element, _ATTACHMENT_PLACEHOLDERS[element.tag])
+
+    if not len(root) and not root.text:
+        return ""
+    serialized = etree.tostring(root, encoding="unicode")
+    return serialized[serialized.index(">") + 1 : serialized.rindex("<")]
+
+
+class _StrictXMLTreeBuilder(LXMLTreeBuilderForXML):
+    """lxml-xml tree builder that raises on malformed input.
+
+    The stock builder parses in recovery mode, which silently truncates
+    documents that are not well-formed instead of letting us fall back to
+    the HTML parser.
+    """
+
+    def default_parser(self, encoding: str | None) -> etree.XMLParser:
+        return etree.XMLParser(
+            target=self, strip_cdata=False, recover=False, encoding=encoding
+        )
+
 
 class ConfluenceClient(Protocol):
     """Protocol for Confluence client."""
@@ -23,6 +243,65 @@ class ConfluenceClient(Protocol):
         ...
 
 
+# Maximum number of concurrent user lookups made while processing a page
+USER_LOOKUP_MAX_WORKERS = 8
+
+# Maximum number of user lookup results kept across pages
+USER_CACHE_MAX_SIZE = 1024
+
+# Seconds before a failed user lookup is retried, so transient errors such as
+# timeouts or rate limiting do not stick for the life of the process
+USER_LOOKUP_FAILURE_TTL = 300.0
+
+
+@dataclass(frozen=True)
+class _FailedUserLookup:
+    """A failed user lookup, kept without the exception and its traceback."""
+
+    message: str
+    expires_at: float
+
+
+class _PrefetchedUserClient:
+    """Confluence client answering user lookups from prefetched results.
+
+    Results are keyed by ("account_id", id) or ("userkey", key) and hold
+    either the user details or a record of the failed lookup. Lookups that
+    were not prefetched are delegated to the wrapped client.
+    """
+
+    def __init__(
+        self,
+        client: ConfluenceClient,
+        results: dict[tuple[str, str], dict[str, Any] | _FailedUserLookup],
+    ) -> None:
+        self._client = client
+        self._results = results
+
+    def get_user_details_by_accountid(self, account_id: str) -> dict[str, Any]:
+        return self._lookup(
+            "account_id", account_id, self._client.get_user_details_by_accountid
+        )
+
+    def get_user_details_by_username(self, username: str) -> dict[str, Any]:
+        return self._lookup(
+            "userkey", username, self._client.get_user_details_by_username
+        )
+
+    def _lookup(
+        self,
+        kind: str,
+        identifier: str,
+        fetch: Callable[[str], dict[str, Any]],
+    ) -> dict[str, Any]:
+        result = self._results.get((kind, identifier))
+        if result is None:
+            return fetch(identifier)
+        if isinstance(result, _FailedUserLookup):
+            raise LookupError(result.message)
+        return result
+
+
 class BasePreprocessor:
     """Base class for text preprocessing operations."""
 
@@ -35,6 +314,15 @@ class BasePreprocessor:
         """
         self.base_url = base_url.rstrip("/") if base_url else ""
 
+        # User lookup results shared across pages, least recently used first.
+        # Failed lookups are cached for USER_LOOKUP_FAILURE_TTL seconds so they
+        # are not retried on every page.
+        self._user_cache: OrderedDict[
+            tuple[str, str], dict[str, Any] | _FailedUserLookup
+        ] = OrderedDict()
+        self._user_cache_client: ConfluenceClient | None = None
+        self._user_cache_lock = threading.Lock()
+
     def process_html_content(
         self,
         html_content: str,
@@ -42,6 +330,8 @@ class BasePreprocessor:
         confluence_client: ConfluenceClient | None = None,
         page_id: str | None = None,
         preserve_inline_attachments: bool = False,
+        *,
+        needs_markdown: bool = True,
     ) -> tuple[str, str]:
         """
         Process HTML content to replace user refs and page links.
@@ -52,30 +342,62 @@ class BasePreprocessor:
             confluence_client: Optional Confluence client for user lookups
             page_id: Optional page ID for attachment URL construction
             preserve_inline_attachments: Whether to inline attachments in content (default: False)
+            needs_markdown: Whether to convert the content to markdown. When
+                False, an empty string is returned as processed_markdown.
 
         Returns:
             Tuple of (processed_html, processed_markdown)
         """
         try:
-            # Remove Confluence search highlighting markers
-            html_content = self._remove_confluence_highlight_markers(html_content)
+            # Remove Confluence search highlighting markers; leading and
+            # trailing whitespace is trimmed here rather than by the parser so
+            # that the fast path below and the parsed path agree on it
+            html_content = self._remove_confluence_highlight_markers(
+                html_content
+            ).strip()
+
+            # Without macros there are no user mentions or attachments to
+            # rewrite, so skip parsing and convert the content directly
+            if not _has_storage_format_elements(html_content):
+                if not needs_markdown:
+                    return html_content, ""
+                return html_content, _markdown_converter().convert(html_content)
+
+            # Rewrite inline attachments on the lxml tree if enabled; the
+            # soup pass below is only needed when that is not possible
+            process_attachments_in_soup = False
+            if (
+                preserve_inline_attachments
+                and confluence_client
+                and page_id
+                and has_attachment_references(html_content)
+            ):
+                rewritten = _rewrite_attachments_lxml(
+                    html_content, self._attachment_url_prefix(page_id)
+                )
+                if rewritten is None:
+                    process_attachments_in_soup = True
+                else:
+                    html_content = rewritten
 
             # Parse the HTML content
-            soup = BeautifulSoup(html_content, "html.parser")
+            soup = self._parse_html(html_content)
 
-            # Process user mentions
-            self._process_user_mentions_in_soup(soup, confluence_client)
-            self._process_user_profile_macros_in_soup(soup, confluence_client)
+            # Process user mentions, resolving all referenced users up front
+            user_client = self._prefetch_user_details(soup, confluence_client)
+            self._process_user_mentions_in_soup(soup, user_client)
+            self._process_user_profile_macros_in_soup(soup, user_client)
 
             # Process inline attachments if enabled
-            if preserve_inline_attachments and confluence_client and page_id:
-                self._process_inline_attachments_in_soup(
-                    soup, confluence_client, page_id, self.base_url
-                )
+            if process_attachments_in_soup and confluence_client and page_id:
+                self._process_inline_attachments_in_soup(soup, page_id)
 
-            # Convert to string and markdown
-            processed_html = str(soup)
-            processed_markdown = md(processed_html)
+            # Convert to string and markdown; the markdown is generated from
+            # the parsed tree rather than by re-parsing processed_html
+            processed_html = self._serialize_fragment(soup)
+            processed_markdown = (
+                _markdown_converter().convert_soup(soup) if needs_markdown else ""
+            )
 
             return processed_html, processed_markdown
 
@@ -83,6 +405,148 @@ class BasePreprocessor:
             logger.error(f"Error in process_html_content: {str(e)}")
             raise
 
+    def _parse_html(self, html_content: str) -> BeautifulSoup:
+        """
+        Parse an HTML fragment into a BeautifulSoup object.
+
+        Confluence Storage Format (content containing ac:/ri: elements) is
+        parsed as namespaced XML with lxml-xml. Everything else, and storage
+        format that is not well-formed XML, uses the C-backed lxml HTML
+        parser, except for content containing CDATA sections (e.g. code
+        macro bodies), which lxml's HTML parser would turn into comments.
+
+        Args:
+            html_content: The HTML content to parse
+
+        Returns:
+            BeautifulSoup object for the content
+        """
+        if _has_storage_format_elements(html_content):
+            try:
+                return BeautifulSoup(
+                    _wrap_storage_format(html_content),
+                    builder=_StrictXMLTreeBuilder,
+                )
+            except (etree.XMLSyntaxError, ParserRejectedMarkup) as e:
+                logger.debug(f"Falling back to HTML parser for storage format: {e}")
+
+        parser = "html.parser" if "<![CDATA[" in html_content else "lxml"
+        return BeautifulSoup(html_content, parser)
+
+    def _serialize_fragment(self, soup: BeautifulSoup) -> str:
+        """
+        Serialize a parsed fragment back to HTML.
+
+        Only the contents of the wrapper added while parsing (the storage
+        format root for XML, <html><body> for lxml) are returned so the
+        output matches the original fragment.
+
+        Args:
+            soup: BeautifulSoup object returned by _parse_html
+
+        Returns:
+            HTML string for the fragment
+        """
+        if soup.is_xml:
+            root = soup.find("ac:confluence", recursive=False)
+            return root.decode_contents() if root is not None else ""
+        body = soup.body
+        return body.decode_contents() if body is not None else str(soup)
+
+    def _prefetch_user_details(
+        self, soup: BeautifulSoup, confluence_client: ConfluenceClient | None
+    ) -> ConfluenceClient | None:
+        """
+        Fetch details for every user referenced by mentions or profile macros.
+
+        Each distinct user is looked up once, concurrently, so a page with
+        many mentions costs roughly one round trip instead of one per mention.
+        Results are cached across pages for as long as the same client is
+        used.
+
+        Args:
+            soup: BeautifulSoup object containing HTML
+            confluence_client: Optional Confluence client for user lookups
+
+        Returns:
+            A client answering lookups from the prefetched results, or None
+            if no client was given
+        """
+        if confluence_client is None:
+            return None
+
+        lookups: set[tuple[str, str]] = set()
+
+        for link in soup.find_all("ac:link"):
+            user_ref = link.find("ri:user")
+            account_id = user_ref.get("ri:account-id") if user_ref else None
+            if account_id and isinstance(account_id, str):
+                lookups.add(("account_id", account_id))
+
+        for macro in soup.find_all("ac:structured-macro", attrs={"ac:name": "profile"}):
+            user_param = macro.find("ac:parameter", attrs={"ac:name": "user"})
+            user_ref = user_param.find("ri:user") if user_param else None
+            if not user_ref:
+                continue
+            account_id = user_ref.get("ri:account-id")
+            userkey = user_ref.get("ri:userkey")
+            if account_id and isinstance(account_id, str):
+                lookups.add(("account_id", account_id))
+            elif userkey and isinstance(userkey, str):
+                lookups.add(("userkey", userkey))
+
+        def fetch(
+            lookup: tuple[str, str],
+        ) -> tuple[tuple[str, str], dict[str, Any] | _FailedUserLookup]:
+            kind, identifier = lookup
+            try:
+                if kind == "account_id":
+                    details = confluence_client.get_user_details_by_accountid(
+                        identifier
+                    )
+                else:
+                    details = confluence_client.get_user_details_by_username(identifier)
+            except Exception as e:
+                return lookup, _FailedUserLookup(
+                    str(e), time.monotonic() + USER_LOOKUP_FAILURE_TTL
+                )
+            return lookup, details
+
+        results: dict[tuple[str, str], dict[str, Any] | _FailedUserLookup] = {}
+        now = time.monotonic()
+        with self._user_cache_lock:
+            if self._user_cache_client is not confluence_client:
+                self._user_cache.clear()
+                self._user_cache_client = confluence_client
+            for lookup in lookups:
+                cached = self._user_cache.get(lookup)
+                if cached is None:
+                    continue
+                if isinstance(cached, _FailedUserLookup) and cached.expires_at <= now:
+                    del self._user_cache[lookup]
+                    continue
+                self._user_cache.move_to_end(lookup)
+                results[lookup] = cached
+        missing = lookups - results.keys()
+
+        if len(missing) > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(USER_LOOKUP_MAX_WORKERS, len(missing))
+            ) as executor:
+                fetched = dict(executor.map(fetch, missing))
+        else:
+            fetched = dict(fetch(lookup) for lookup in missing)
+
+        if fetched:
+            with self._user_cache_lock:
+                if self._user_cache_client is confluence_client:
+                    self._user_cache.update(fetched)
+                    while len(self._user_cache) > USER_CACHE_MAX_SIZE:
+                        self._user_cache.popitem(last=False)
+            results.update(fetched)
+
+        return _PrefetchedUserClient(confluence_client, results)
+
     def _process_user_mentions_in_soup(
         self, soup: BeautifulSoup, confluence_client: ConfluenceClient | None = None
     ) -> None:
@@ -97,26 +561,14 @@ class BasePreprocessor:
         user_mentions = soup.find_all("ac:link")
 
         for user_element in user_mentions:
+            # A user reference is replaced whether or not the link has an
+            # ac:link-body, so the ri:user element is all that matters
             user_ref = user_element.find("ri:user")
-            if user_ref and user_ref.get("ri:account-id"):
-                # Case 1: Direct user reference without link-body
-                account_id = user_ref.get("ri:account-id")
-                if isinstance(account_id, str):
-                    self._replace_user_mention(
-                        user_element, account_id, confluence_client
-                    )
-                    continue
-
-            # Case 2: User reference with link-body containing @
-            link_body = user_element.find("ac:link-body")
-            if link_body and "@" in link_body.get_text(strip=True):
-                user_ref = user_element.find("ri:user")
-                if user_ref and user_ref.get("ri:account-id"):
-                    account_id = user_ref.get("ri:account-id")
-                    if isinstance(account_id, str):
-                        self._replace_user_mention(
-                            user_element, account_id, confluence_client
-                        )
+            if not user_ref:
+                continue
+            account_id = user_ref.get("ri:account-id")
+            if account_id and isinstance(account_id, str):
+                self._replace_user_mention(user_element, account_id, confluence_client)
 
     def _process_user_profile_macros_in_soup(
         self, soup: BeautifulSoup, confluence_client: ConfluenceClient | None = None
@@ -237,11 +689,7 @@ class BasePreprocessor:
         user_element.replace_with(new_text)
 
     def _process_inline_attachments_in_soup(
-        self,
-        soup: BeautifulSoup,
-        confluence_client: ConfluenceClient,
-        page_id: str,
-        base_url: str,
+        self, soup: BeautifulSoup, page_id: str
     ) -> None:
         """
         Process inline attachments in BeautifulSoup object.
@@ -249,177 +697,167 @@ class BasePreprocessor:
 
         Args:
             soup: BeautifulSoup object containing HTML
-            confluence_client: Confluence client for attachment lookups
             page_id: Page ID for attachment URL construction
-            base_url: Base URL for attachment download URLs
         """
-        # Process ac:image macros (images)
-        self._process_ac_image_macros(soup, confluence_client, page_id, base_url)
-
-        # Process ri:attachment references (links)
-        self._process_ri_attachment_macros(soup, confluence_client, page_id, base_url)
-
-        # Process ac:link with ri:attachment (attachment links)
-        self._process_ac_link_attachment_macros(soup, confluence_client, page_id, base_url)
+        self._rewrite_attachments_single_pass(
+            soup, self._attachment_url_prefix(page_id)
+        )
 
-    def _process_ac_image_macros(
-        self,
-        soup: BeautifulSoup,
-        confluence_client: ConfluenceClient,
-        page_id: str,
-        base_url: str,
+    @classmethod
+    def _rewrite_attachments_single_pass(
+        cls, soup: BeautifulSoup, url_prefix: str
     ) -> None:
-        """Process ac:image macros for inline images."""
-        image_macros = soup.find_all("ac:image")
-
-        for image_macro in image_macros:
-            try:
-                # Extract attachment reference
-                attachment_ref = image_macro.find("ri:attachment")
-                if not attachment_ref:
-                    continue
+        """
+        Replace ac:image, ac:link and ri:attachment macros in one traversal.
 
-                filename = attachment_ref.get("ri:filename")
-                if not filename:
-                    continue
+        The walk does not descend into ac:image or ac:link elements, so an
+        ri:attachment nested in one is handled with its macro rather than
+        on its own. Replacements are collected and applied after the walk
+        so the traversal is not invalidated.
 
-                # Get alt text from parameters
-                alt_text = ""
-                ac_params = image_macro.find_all("ac:parameter")
-                for param in ac_params:
-                    if param.get("ac:name") in ["alt", "title", "caption"]:
-                        alt_text = param.get_text(strip=True)
-                        break
+        Args:
+            soup: BeautifulSoup object containing HTML
+            url_prefix: Download URL prefix for the page's attachments
+        """
+        edits: list[tuple[Tag, Tag | str]] = []
+        stack: list[Tag] = [soup]
 
-                # Construct download URL
-                download_url = self._construct_attachment_download_url(
-                    base_url, page_id, filename
-                )
+        while stack:
+            node = stack.pop()
+            for child in node.children:
+                if not isinstance(child, Tag):
+                    continue
 
-                # Create inline image element
-                if alt_text:
-                    img_tag = soup.new_tag("img", src=download_url, alt=alt_text)
+                # XML parsing keeps the prefix separate from the local name
+                name = f"{child.prefix}:{child.name}" if child.prefix else child.name
+                if name == "ac:image":
+                    replacement = cls._ac_image_replacement(soup, child, url_prefix)
+                elif name == "ac:link":
+                    replacement = cls._ac_link_attachment_replacement(
+                        soup, child, url_prefix
+                    )
+                elif name == "ri:attachment":
+                    replacement = cls._ri_attachment_replacement(
+                        soup, child, url_prefix
+                    )
                 else:
-                    img_tag = soup.new_tag("img", src=download_url, alt=filename)
-
-                # Replace the macro with the image
-                image_macro.replace_with(img_tag)
-
-            except Exception as e:
-                logger.warning(f"Error processing ac:image macro: {str(e)}")
-                # Replace with placeholder on error
-                image_macro.replace_with("[Image attachment]")
+                    stack.append(child)
+                    continue
 
-    def _process_ri_attachment_macros(
-        self,
-        soup: BeautifulSoup,
-        confluence_client: ConfluenceClient,
-        page_id: str,
-        base_url: str,
-    ) -> None:
-        """Process ri:attachment references for inline attachments."""
-        attachment_refs = soup.find_all("ri:attachment")
+                if replacement is not None:
+                    edits.append((child, replacement))
 
-        for attachment_ref in attachment_refs:
-            try:
-                filename = attachment_ref.get("ri:filename")
-                if not filename:
-                    continue
+        for element, replacement in edits:
+            element.replace_with(replacement)
 
-                # Skip if this is inside an ac:image (already processed)
-                if attachment_ref.find_parent("ac:image"):
-                    continue
+    @staticmethod
+    def _ac_image_replacement(
+        soup: BeautifulSoup, image_macro: Tag, url_prefix: str
+    ) -> Tag | str | None:
+        """Build the inline image replacing an ac:image macro."""
+        try:
+            # Extract attachment reference
+            attachment_ref = image_macro.find("ri:attachment")
+            if not attachment_ref:
+                return None
 
-                # Skip if this is inside an ac:link (will be processed separately)
-                if attachment_ref.find_parent("ac:link"):
-                    continue
+            filename = attachment_ref.get("ri:filename")
+            if not filename:
+                return None
 
-                # Construct download URL
-                download_url = self._construct_attachment_download_url(
-                    base_url, page_id, filename
-                )
+            # Get alt text from parameters
+            alt_text = ""
+            ac_params = image_macro.find_all("ac:parameter")
+            for param in ac_params:
+                if param.get("ac:name") in ["alt", "title", "caption"]:
+                    alt_text = param.get_text(strip=True)
+                    break
 
-                # Create link element
-                link_tag = soup.new_tag("a", href=download_url)
-                link_tag.string = filename
+            # Construct download URL
+            download_url = url_prefix + quote_attachment_filename(filename)
 
-                # Replace the reference with the link
-                attachment_ref.replace_with(link_tag)
+            # Create inline image element
+            return soup.new_tag("img", src=download_url, alt=alt_text or filename)
 
-            except Exception as e:
-                logger.warning(f"Error processing ri:attachment: {str(e)}")
-                # Replace with placeholder on error
-                attachment_ref.replace_with("[Attachment]")
+        except Exception as e:
+            logger.warning(f"Error processing ac:image macro: {str(e)}")
+            # Replace with placeholder on error
+            return "[Image attachment]"
+
+    @staticmethod
+    def _ri_attachment_replacement(
+        soup: BeautifulSoup, attachment_ref: Tag, url_prefix: str
+    ) -> Tag | str | None:
+        """Build the link replacing a plain ri:attachment reference."""
+        try:
+            filename = attachment_ref.get("ri:filename")
+            if not filename:
+                return None
 
-    def _process_ac_link_attachment_macros(
-        self,
-        soup: BeautifulSoup,
-        confluence_client: ConfluenceClient,
-        page_id: str,
-        base_url: str,
-    ) -> None:
-        """Process ac:link elements containing ri:attachment."""
-        link_macros = soup.find_all("ac:link")
+            # Construct download URL
+            download_url = url_prefix + quote_attachment_filename(filename)
 
-        for link_macro in link_macros:
-            try:
-                attachment_ref = link_macro.find("ri:attachment")
-                if not attachment_ref:
-                    continue
+            # Create link element
+            link_tag = soup.new_tag("a", href=download_url)
+            link_tag.append(NavigableString(filename))
+            return link_tag
 
-                filename = attachment_ref.get("ri:filename")
-                if not filename:
-                    continue
+        except Exception as e:
+            logger.warning(f"Error processing ri:attachment: {str(e)}")
+            # Replace with placeholder on error
+            return "[Attachment]"
+
+    @staticmethod
+    def _ac_link_attachment_replacement(
+        soup: BeautifulSoup, link_macro: Tag, url_prefix: str
+    ) -> Tag | str | None:
+        """Build the link replacing an ac:link element containing ri:attachment."""
+        try:
+            attachment_ref = link_macro.find("ri:attachment")
+            if not attachment_ref:
+                return None
 
-                # Get link text from ac:link-body
-                link_body = link_macro.find("ac:link-body")
-                link_text = link_body.get_text(strip=True) if link_body else filename
+            filename = attachment_ref.get("ri:filename")
+            if not filename:
+                return None
 
-                # Construct download URL
-                download_url = self._construct_attachment_download_url(
-                    base_url, page_id, filename
-                )
+            # Get link text from ac:link-body
+            link_body = link_macro.find("ac:link-body")
+            link_text = link_body.get_text(strip=True) if link_body else filename
 
-                # Create link element
-                link_tag = soup.new_tag("a", href=download_url)
-                link_tag.string = link_text
+            # Construct download URL
+            download_url = url_prefix + quote_attachment_filename(filename)
 
-                # Replace the macro with the link
-                link_macro.replace_with(link_tag)
+            # Create link element
+            link_tag = soup.new_tag("a", href=download_url)
+            link_tag.append(NavigableString(link_text))
+            return link_tag
 
-            except Exception as e:
-                logger.warning(f"Error processing ac:link with ri:attachment: {str(e)}")
-                # Replace with placeholder on error
-                link_macro.replace_with("[Attachment link]")
+        except Exception as e:
+            logger.warning(f"Error processing ac:link with ri:attachment: {str(e)}")
+            # Replace with placeholder on error
+            return "[Attachment link]"
 
-    def _construct_attachment_download_url(
-        self, base_url: str, page_id: str, filename: str
-    ) -> str:
+    def _attachment_url_prefix(self, page_id: str) -> str:
         """
-        Construct attachment download URL.
+        Construct the download URL prefix for a page's attachments.
         Always uses proxy URLs with configured or default settings.
 
         Args:
-            base_url: Base URL of Confluence instance
-            page_id: Page ID containing the attachment
-            filename: Attachment filename
+            page_id: Page ID containing the attachments
 
         Returns:
-            Download URL for the attachment
+            URL prefix to which the encoded attachment filename is appended
         """
-        # URL encode the filename
-        from urllib.parse import quote
-        encoded_filename = quote(filename)
-
         # Use configured proxy settings or defaults
-        proxy_host = getattr(self, 'proxy_host', None) or "localhost"
-        proxy_port = getattr(self, 'proxy_port', None) or 8002
-        proxy_base_path = getattr(self, 'proxy_base_path', None) or "/proxy"
+        proxy_host = getattr(self, "proxy_host", None) or "localhost"
+        proxy_port = getattr(self, "proxy_port", None) or 8002
+        proxy_base_path = getattr(self, "proxy_base_path", None) or "/proxy"
 
         # Always use proxy URL format: http://localhost:8002/proxy/confluence/attachment/{pageId}/{filename}
-        download_url = f"http://{proxy_host}:{proxy_port}{proxy_base_path}/confluence/attachment/{page_id}/{encoded_filename}"
-        logger.debug(f"Using proxy URL for attachment: {download_url}")
-        return download_url
+        url_prefix = f"http://{proxy_host}:{proxy_port}{proxy_base_path}/confluence/attachment/{page_id}/"
+        logger.debug(f"Using proxy URL prefix for attachments: {url_prefix}")
+        return url_prefix
 
     def _remove_confluence_highlight_markers(self, html_content: str) -> str:
         """
@@ -439,13 +877,12 @@ class BasePreprocessor:
 
     def _convert_html_to_markdown(self, text: str) -> str:
         """Convert HTML content to markdown if needed."""
-        if re.search(r"<[^>]+>", text):
+        if "<" in text and ">" in text and _TAG_RE.search(text):
             try:
                 with warnings.catch_warnings():
                     warnings.filterwarnings("ignore", category=UserWarning)
-                    soup = BeautifulSoup(f"<div>{text}</div>", "html.parser")
-                    html = str(soup.div.decode_contents()) if soup.div else text
-                    text = md(html)
+                    soup = self._parse_html(f"<div>{text}</div>")
+                    text = _markdown_converter().convert_soup(soup)
             except Exception as e:
                 logger.warning(f"Error converting HTML to markdown: {str(e)}")
         return text
@@ -1,8 +1,12 @@
 """Confluence-specific text preprocessing module."""
 
 import logging
+import re
 import shutil
 import tempfile
+import threading
+import weakref
+from html import escape, unescape
 from pathlib import Path
 
 from md2conf.converter import (
@@ -13,10 +17,112 @@ from md2conf.converter import (
     markdown_to_html,
 )
 
-from .base import BasePreprocessor, ConfluenceClient
+from .base import (
+    BasePreprocessor,
+    ConfluenceClient,
+    has_attachment_references,
+    quote_attachment_filename,
+)
 
 logger = logging.getLogger("mcp-atlassian")
 
+# Attachment macros in the shapes Confluence usually emits them. Matching is
+# leftmost-first, so an ri:attachment inside an ac:image/ac:link is always
+# consumed together with its macro, and CDATA sections (e.g. code macro
+# bodies showing storage format) are consumed whole and left unchanged.
+_ATTACHMENT_MACRO_RE = re.compile(
+    r"(?P<cdata><!\[CDATA\[.*?\]\]>)"
+    r"|<ac:image\b[^>]*(?<!/)>(?P<image>.*?)</ac:image>"
+    r"|<ac:link\b[^>]*(?<!/)>(?P<link>.*?)</ac:link>"
+    r"|<ri:attachment\b(?P<attachment>[^>]*)/>",
+    re.DOTALL,
+)
+_RI_ATTACHMENT_RE = re.compile(r"<ri:attachment\b([^>]*)/>")
+_AC_PARAMETER_RE = re.compile(r"<ac:parameter\b([^>]*)>([^<]*)</ac:parameter>")
+_AC_LINK_BODY_RE = re.compile(r"<ac:link-body>([^<]*)</ac:link-body>")
+_ATTRIBUTE_RE = re.compile(r'([\w:-]+)="([^"]*)"')
+_CDATA_RE = re.compile(r"<!\[CDATA\[.*?\]\]>", re.DOTALL)
+
+
+def _attachment_filename(attributes: str) -> str:
+    """Extract the unescaped ri:filename from an attribute string."""
+    attrs = dict(_ATTRIBUTE_RE.findall(attributes))
+    return unescape(attrs.get("ri:filename", ""))
+
+
+def _rewrite_attachments_regex(html_content: str, url_prefix: str) -> str | None:
+    """
+    Rewrite simple attachment macros directly on the storage format string.
+
+    Handles ac:image macros holding an ri:attachment and optional
+    ac:parameter elements, ac:link macros holding an ri:attachment and an
+    optional plain-text ac:link-body, and self-closing ri:attachment
+    references. Anything more complex is left for the tree-based rewrite.
+
+    Args:
+        html_content: Storage format content to rewrite
+        url_prefix: Download URL prefix for the page's attachments
+
+    Returns:
+        The rewritten content, or None if some attachment macro could not be
+        rewritten and the content needs the tree-based rewrite instead
+    """
+
+    def replace(match: re.Match[str]) -> str:
+        if match.group("cdata") is not None:
+            return match.group(0)
+
+        attachment = match.group("attachment")
+        if attachment is not None:
+            filename = _attachment_filename(attachment)
+            if not filename:
+                return match.group(0)
+            url = escape(url_prefix + quote_attachment_filename(filename))
+            return f'<a href="{url}">{escape(filename, quote=False)}</a>'
+
+        body = match.group("image")
+        is_image = body is not None
+        if not is_image:
+            body = match.group("link")
+
+        attachments = _RI_ATTACHMENT_RE.findall(body)
+        if len(attachments) != 1:
+            return match.group(0)
+        filename = _attachment_filename(attachments[0])
+        if not filename:
+            return match.group(0)
+        url = escape(url_prefix + quote_attachment_filename(filename))
+
+        if is_image:
+            remainder = _AC_PARAMETER_RE.sub("", _RI_ATTACHMENT_RE.sub("", body))
+            if remainder.strip():
+                return match.group(0)
+            alt_text = ""
+            for param_attributes, param_text in _AC_PARAMETER_RE.findall(body):
+                attrs = dict(_ATTRIBUTE_RE.findall(param_attributes))
+                if attrs.get("ac:name") in ["alt", "title", "caption"]:
+                    alt_text = unescape(param_text).strip()
+                    break
+            return f'<img alt="{escape(alt_text or filename)}" src="{url}"/>'
+
+        remainder = _AC_LINK_BODY_RE.sub("", _RI_ATTACHMENT_RE.sub("", body))
+        if remainder.strip():
+            return match.group(0)
+        link_body = _AC_LINK_BODY_RE.search(body)
+        link_text = unescape(link_body.group(1)).strip() if link_body else filename
+        return f'<a href="{url}">{escape(link_text, quote=False)}</a>'
+
+    rewritten = _ATTACHMENT_MACRO_RE.sub(replace, html_content)
+
+    # Attachments left outside CDATA sections need the tree-based rewrite;
+    # other ac:image macros (e.g. external ri:url images) are not rewritten
+    remaining = rewritten
+    if "<![CDATA[" in remaining:
+        remaining = _CDATA_RE.sub("", remaining)
+    if "<ri:attachment" in remaining:
+        return None
+    return rewritten
+
 
 class ConfluencePreprocessor(BasePreprocessor):
     """Handles text preprocessing for Confluence content."""
@@ -45,6 +151,36 @@ class ConfluencePreprocessor(BasePreprocessor):
         self.proxy_port = proxy_port
         self.proxy_base_path = proxy_base_path
 
+        # Converter options only vary with heading anchor generation
+        self._converter_options = {
+            heading_anchors: ConfluenceConverterOptions(
+                ignore_invalid_url=True,
+                heading_anchors=heading_anchors,
+                render_mermaid=False,
+            )
+            for heading_anchors in (False, True)
+        }
+        self._converter_dir: Path | None = None
+        self._converter_dir_lock = threading.Lock()
+
+    def _get_converter_dir(self) -> Path:
+        """
+        Get the directory md2conf resolves relative paths against.
+
+        The directory is created on first use and removed when the
+        preprocessor is garbage collected, instead of creating and removing
+        a temporary directory for every conversion.
+
+        Returns:
+            Path to the persistent temporary directory
+        """
+        with self._converter_dir_lock:
+            if self._converter_dir is None:
+                temp_dir = tempfile.mkdtemp()
+                weakref.finalize(self, shutil.rmtree, temp_dir, ignore_errors=True)
+                self._converter_dir = Path(temp_dir)
+            return self._converter_dir
+
     def markdown_to_confluence_storage(
         self, markdown_content: str, *, enable_heading_anchors: bool = False
     ) -> str:
@@ -58,50 +194,38 @@ class ConfluencePreprocessor(BasePreprocessor):
         Returns:
             Confluence storage format (XHTML) string
         """
+        # First convert markdown to HTML; the fallback below reuses it
+        html_content = markdown_to_html(markdown_content)
+
         try:
-            # First convert markdown to HTML
-            html_content = markdown_to_html(markdown_content)
-
-            # Create a temporary directory for any potential attachments
-            temp_dir = tempfile.mkdtemp()
-
-            try:
-                # Parse the HTML into an element tree
-                root = elements_from_string(html_content)
-
-                # Create converter options
-                options = ConfluenceConverterOptions(
-                    ignore_invalid_url=True,
-                    heading_anchors=enable_heading_anchors,
-                    render_mermaid=False,
-                )
-
-                # Create a converter
-                converter = ConfluenceStorageFormatConverter(
-                    options=options,
-                    path=Path(temp_dir) / "temp.md",
-                    root_dir=Path(temp_dir),
-                    page_metadata={},
-                )
-
-                # Transform the HTML to Confluence storage format
-                converter.visit(root)
-
-                # Convert the element tree back to a string
-                storage_format = elements_to_string(root)
-
-                return str(storage_format)
-            finally:
-                # Clean up the temporary directory
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            # Directory for any potential attachments
+            converter_dir = self._get_converter_dir()
+
+            # Parse the HTML into an element tree
+            root = elements_from_string(html_content)
+
+            # Create a converter; it collects links and images while visiting,
+            # so a fresh one is needed for each conversion
+            converter = ConfluenceStorageFormatConverter(
+                options=self._converter_options[enable_heading_anchors],
+                path=converter_dir / "temp.md",
+                root_dir=converter_dir,
+                page_metadata={},
+            )
+
+            # Transform the HTML to Confluence storage format
+            converter.visit(root)
+
+            # Convert the element tree back to a string
+            storage_format = elements_to_string(root)
+
+            return str(storage_format)
 
         except Exception as e:
             logger.error(f"Error converting markdown to Confluence storage format: {e}")
             logger.exception(e)
 
             # Fall back to a simpler method if the conversion fails
-            html_content = markdown_to_html(markdown_content)
-
             # Use a different approach that doesn't rely on the HTML macro
             # This creates a proper Confluence storage format document
             storage_format = f"""<p>{html_content}</p>"""
@@ -115,6 +239,8 @@ class ConfluencePreprocessor(BasePreprocessor):
         confluence_client: ConfluenceClient | None = None,
         page_id: str | None = None,
         preserve_inline_attachments: bool | None = None,
+        *,
+        needs_markdown: bool = True,
     ) -> tuple[str, str]:
         """
         Process HTML content to replace user refs and page links.
@@ -126,6 +252,8 @@ class ConfluencePreprocessor(BasePreprocessor):
             page_id: Optional page ID for attachment URL construction
             preserve_inline_attachments: Whether to inline attachments in content.
                                       If None, uses the instance setting.
+            needs_markdown: Whether to convert the content to markdown. When
+                False, an empty string is returned as processed_markdown.
 
         Returns:
             Tuple of (processed_html, processed_markdown)
@@ -134,6 +262,24 @@ class ConfluencePreprocessor(BasePreprocessor):
         if preserve_inline_attachments is None:
             preserve_inline_attachments = self.preserve_inline_attachments
 
+        # Rewrite simple attachment macros on the raw string; the parent only
+        # has to process attachments when that is not possible
+        if (
+            preserve_inline_attachments
+            and confluence_client
+            and page_id
+            and has_attachment_references(html_content)
+        ):
+            # Strip search highlight markers first so they do not end up in
+            # the attachment URLs built from ri:filename
+            html_content = self._remove_confluence_highlight_markers(html_content)
+            rewritten = _rewrite_attachments_regex(
+                html_content, self._attachment_url_prefix(page_id)
+            )
+            if rewritten is not None:
+                html_content = rewritten
+                preserve_inline_attachments = False
+
         # Call parent method with the preserve_inline_attachments parameter
         processed_html, processed_markdown = super().process_html_content(
             html_content=html_content,
@@ -141,6 +287,7 @@ class ConfluencePreprocessor(BasePreprocessor):
             confluence_client=confluence_client,
             page_id=page_id,
             preserve_inline_attachments=preserve_inline_attachments,
+            needs_markdown=needs_markdown,
         )
 
         # Only process attachments, no external links
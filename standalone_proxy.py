@@ -7,16 +7,29 @@
 import os
 import re
 import logging
+import functools
+import hashlib
+import ipaddress
 import mimetypes
-from typing import Optional
-from urllib.parse import quote, unquote
+import shutil
+import socket
+import tempfile
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable, Hashable
+from pathlib import Path
+from typing import Any, BinaryIO
+from urllib.parse import quote, unquote, urljoin, urlparse
 import asyncio
 
 import aiohttp
+import aiohttp.abc
+import orjson
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
-from cachetools import TTLCache
+from cachetools import LFUCache, TTLCache
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -38,8 +51,87 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 缓存
-cache = TTLCache(maxsize=1000, ttl=3600)
+
+class TTLLFUCache(LFUCache):
+    """按访问频率淘汰的缓存，条目在写入 ttl 秒后过期
+
+    与纯 TTL/LRU 缓存不同，热点附件不会被一次性访问的冷门附件挤出缓存。
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        getsizeof: Callable[[Any], int] | None = None
+    ) -> None:
+        super().__init__(maxsize, getsizeof=getsizeof)
+        self.ttl = ttl
+        # ttl 固定，按写入顺序排列即按过期时间排列
+        self._expires: OrderedDict[Hashable, float] = OrderedDict()
+        # 写入时淘汰条目的过程中不做过期清理，避免删除正在淘汰的条目
+        self._evicting = False
+
+    def __contains__(self, key: Hashable) -> bool:
+        self.expire()
+        return super().__contains__(key)
+
+    def __getitem__(self, key: Hashable) -> Any:
+        self.expire()
+        return super().__getitem__(key)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """查找条目，只做一次过期清理，避免 Cache.get 的先判断再取值"""
+        self.expire()
+        try:
+            return super().__getitem__(key)
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self.expire()
+        self._evicting = True
+        try:
+            super().__setitem__(key, value)
+        finally:
+            self._evicting = False
+        self._expires[key] = time.monotonic() + self.ttl
+        self._expires.move_to_end(key)
+
+    def __delitem__(self, key: Hashable) -> None:
+        super().__delitem__(key)
+        self._expires.pop(key, None)
+
+    def clear(self) -> None:
+        super().clear()
+        self._expires.clear()
+
+    def expire(self) -> None:
+        """删除所有已过期的条目"""
+        if self._evicting:
+            return
+        now = time.monotonic()
+        while self._expires:
+            key, expires_at = next(iter(self._expires.items()))
+            if expires_at > now:
+                break
+            del self._expires[key]
+            # 条目可能已被不经过 __delitem__ 的操作移除
+            if super().__contains__(key):
+                del self[key]
+
+
+class DiskCache(TTLLFUCache):
+    """附件内容保存在磁盘文件中的缓存，条目被删除、淘汰或过期时同时删除文件"""
+
+    def __delitem__(self, key: Hashable) -> None:
+        super().__delitem__(key)
+        _disk_cache_path(key).unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        for key in self._expires:
+            _disk_cache_path(key).unlink(missing_ok=True)
+        super().clear()
+
 
 # 配置
 CONFLUENCE_URL = os.getenv("CONFLUENCE_URL", "")
@@ -47,6 +139,409 @@ CONFLUENCE_USERNAME = os.getenv("CONFLUENCE_USERNAME", "")
 CONFLUENCE_API_TOKEN = os.getenv("CONFLUENCE_API_TOKEN", "")
 PROXY_BASE_PATH = os.getenv("PROXY_BASE_PATH", "/proxy")
 
+# 请求间不变的 Confluence 基础 URL、认证信息和 URL 前缀，启动时计算一次
+_CONFLUENCE_BASE = CONFLUENCE_URL.rstrip('/') if CONFLUENCE_URL else ""
+_CONFLUENCE_AUTH = (
+    aiohttp.BasicAuth(CONFLUENCE_USERNAME, CONFLUENCE_API_TOKEN)
+    if CONFLUENCE_USERNAME else None
+)
+_CONFLUENCE_CONFIGURED = bool(
+    CONFLUENCE_URL and CONFLUENCE_USERNAME and CONFLUENCE_API_TOKEN
+)
+_DL_PREFIX = _CONFLUENCE_BASE + "/download/attachments/"
+_CONTENT_API_PREFIX = _CONFLUENCE_BASE + "/rest/api/content/"
+
+# 通用代理允许访问的主机，逗号分隔；未配置时拒绝内网地址
+PROXY_ALLOWED_HOSTS = frozenset(
+    host.strip().lower()
+    for host in os.getenv("PROXY_ALLOWED_HOSTS", "").split(",")
+    if host.strip()
+)
+
+# 通用代理最多跟随的重定向次数
+MAX_GENERAL_REDIRECTS = 5
+_REDIRECT_STATUSES = frozenset({301, 302, 303, 307, 308})
+
+# 附件缓存的总字节预算，默认 256 MiB
+CACHE_MAX_BYTES = int(os.getenv("PROXY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# 小于该大小的附件缓存在内存中，更大的附件边转发边写入磁盘缓存
+CACHE_MAX_CONTENT_LENGTH = 1024 * 1024
+
+# 磁盘缓存目录，每个工作进程在其中使用独立的子目录
+CACHE_DIR = Path(
+    os.getenv("PROXY_CACHE_DIR")
+    or os.path.join(tempfile.gettempdir(), "atlassian-proxy-cache")
+)
+
+# 磁盘缓存的总字节预算，默认 4 GiB
+DISK_CACHE_MAX_BYTES = int(
+    os.getenv("PROXY_DISK_CACHE_MAX_BYTES", str(4 * 1024 * 1024 * 1024))
+)
+
+# 流式转发时每次读取的块大小
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 上游响应体的大小上限，默认 100 MiB，超过时拒绝转发
+MAX_BODY = int(os.getenv("PROXY_MAX_BODY", str(100 * 1024 * 1024)))
+
+# 附件缓存条目在该时间内直接返回，超过后带 ETag / Last-Modified 向上游重新验证
+ATTACHMENT_FRESH_TTL = 3600
+
+# 附件缓存条目的最长保留时间，期间未变化的附件只需上游返回 304
+ATTACHMENT_STALE_TTL = 86400
+
+# 附件缓存，键为 (page_id, attachment_id)，按附件字节数计入预算
+cache = TTLLFUCache(
+    maxsize=CACHE_MAX_BYTES,
+    ttl=ATTACHMENT_STALE_TTL,
+    getsizeof=lambda entry: len(entry["content"])
+)
+
+# 较大附件的磁盘缓存，只在内存中保存元数据，命中时从文件逐块发送
+disk_cache = DiskCache(
+    maxsize=DISK_CACHE_MAX_BYTES,
+    ttl=ATTACHMENT_STALE_TTL,
+    getsizeof=lambda entry: entry["size"]
+)
+
+# 本进程的磁盘缓存子目录，在服务启动时创建，创建失败时不使用磁盘缓存
+_cache_dir: Path | None = None
+
+# 上游返回 404 的附件，短时间内不再重复请求
+missing_cache = TTLCache(maxsize=1000, ttl=60)
+
+# 正在从上游获取的附件，相同附件的并发请求等待同一次获取完成
+_INFLIGHT: dict[tuple[str, str], asyncio.Future[HTTPException | None]] = {}
+
+# 替换链接后的页面，键为 (page_id, 代理基础 URL)，命中时按版本号重新验证
+page_cache = TTLCache(maxsize=2000, ttl=60)
+
+# 同时向 Confluence 发起的请求数上限，突发流量时排队等待而不是压垮上游
+UPSTREAM_CONCURRENCY = int(os.getenv("PROXY_UPSTREAM_CONCURRENCY", "50"))
+_UPSTREAM_SEM = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+
+# 共享的 HTTP 会话，在服务启动时创建，复用连接池避免每个请求重新握手
+SESSION_CONFLUENCE: aiohttp.ClientSession | None = None
+SESSION_GENERAL: aiohttp.ClientSession | None = None
+
+
+# 空闲连接的保持时间，需短于上游服务器的 keep-alive 超时
+# (Tomcat 默认 20 秒)，避免复用已被上游关闭的连接
+UPSTREAM_KEEPALIVE_TIMEOUT = 15
+
+
+class DisallowedAddressError(OSError):
+    """主机名只解析到内网地址，通用代理拒绝连接"""
+
+
+def _is_public_address(address: str) -> bool:
+    """检查 IP 地址是否为公网地址"""
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        return False
+
+
+class PublicAddressResolver(aiohttp.abc.AbstractResolver):
+    """只返回公网地址的 DNS 解析器，防止通用代理通过解析到内网的域名访问内网服务"""
+
+    def __init__(self) -> None:
+        self._resolver = aiohttp.DefaultResolver()
+
+    async def resolve(
+        self,
+        host: str,
+        port: int = 0,
+        family: socket.AddressFamily = socket.AF_INET
+    ) -> list[dict[str, Any]]:
+        addresses = await self._resolver.resolve(host, port, family)
+        public = [addr for addr in addresses if _is_public_address(addr["host"])]
+        if not public:
+            msg = f"{host} 未解析到公网地址"
+            raise DisallowedAddressError(msg)
+        return public
+
+    async def close(self) -> None:
+        await self._resolver.close()
+
+
+def _create_connector(
+    resolver: aiohttp.abc.AbstractResolver | None = None
+) -> aiohttp.TCPConnector:
+    """创建带连接池和 DNS 缓存的连接器"""
+    return aiohttp.TCPConnector(
+        limit=200,
+        limit_per_host=50,
+        ttl_dns_cache=300,
+        keepalive_timeout=UPSTREAM_KEEPALIVE_TIMEOUT,
+        resolver=resolver
+    )
+
+
+async def _upstream_get(
+    session: aiohttp.ClientSession,
+    url: str,
+    headers: dict[str, str] | None = None,
+    *,
+    allow_redirects: bool = True
+) -> aiohttp.ClientResponse:
+    """发起 GET 请求，复用的空闲连接已被上游关闭时重试一次"""
+    try:
+        return await session.get(
+            url, headers=headers, allow_redirects=allow_redirects
+        )
+    except aiohttp.ServerDisconnectedError:
+        logger.debug(f"上游连接已关闭，重试: {url}")
+        return await session.get(
+            url, headers=headers, allow_redirects=allow_redirects
+        )
+
+
+@app.on_event("startup")
+async def create_sessions() -> None:
+    """启动时创建共享的 HTTP 会话"""
+    global SESSION_CONFLUENCE, SESSION_GENERAL
+    timeout = aiohttp.ClientTimeout(total=30)
+
+    # Confluence 会话携带认证信息
+    SESSION_CONFLUENCE = aiohttp.ClientSession(
+        auth=_CONFLUENCE_AUTH,
+        connector=_create_connector(),
+        timeout=timeout
+    )
+    # 通用代理会话不携带认证信息，避免泄露 Confluence 凭据；
+    # 未配置允许的主机时只连接解析到公网地址的主机
+    SESSION_GENERAL = aiohttp.ClientSession(
+        connector=_create_connector(
+            None if PROXY_ALLOWED_HOSTS else PublicAddressResolver()
+        ),
+        timeout=timeout
+    )
+
+
+@app.on_event("startup")
+async def create_cache_dir() -> None:
+    """启动时创建本进程的磁盘缓存目录"""
+    global _cache_dir
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _cache_dir = Path(tempfile.mkdtemp(prefix=f"{os.getpid()}-", dir=CACHE_DIR))
+    except OSError as e:
+        logger.warning(f"无法创建磁盘缓存目录 {CACHE_DIR}，较大的附件将不缓存: {e}")
+
+
+@app.on_event("shutdown")
+async def remove_cache_dir() -> None:
+    """关闭时删除本进程的磁盘缓存目录"""
+    global _cache_dir
+    if _cache_dir is not None:
+        disk_cache.clear()
+        shutil.rmtree(_cache_dir, ignore_errors=True)
+        _cache_dir = None
+
+
+@app.on_event("shutdown")
+async def close_sessions() -> None:
+    """关闭时释放共享的 HTTP 会话"""
+    if SESSION_CONFLUENCE is not None:
+        await SESSION_CONFLUENCE.close()
+    if SESSION_GENERAL is not None:
+        await SESSION_GENERAL.close()
+
+
+def _check_content_length(response: aiohttp.ClientResponse) -> None:
+    """上游声明的响应体大小超过 MAX_BODY 时释放连接并返回 413"""
+    if response.content_length is not None and response.content_length > MAX_BODY:
+        response.release()
+        raise HTTPException(status_code=413, detail="上游响应体过大")
+
+
+def _check_streamed_size(size: int, url: Any) -> None:
+    """流式转发的字节数超过 MAX_BODY 时中止传输，响应头已发送，只能断开连接"""
+    if size > MAX_BODY:
+        logger.warning(f"上游响应体超过 {MAX_BODY} 字节，中止转发: {url}")
+        raise RuntimeError("上游响应体过大")
+
+
+async def _read_body(response: aiohttp.ClientResponse) -> bytes:
+    """读取上游响应体，超过 MAX_BODY 时返回 413"""
+    _check_content_length(response)
+    chunks = []
+    size = 0
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_BODY:
+            raise HTTPException(status_code=413, detail="上游响应体过大")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _stream_body(response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+    """逐块转发上游响应体，发送完毕后释放连接"""
+    size = 0
+    try:
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            size += len(chunk)
+            _check_streamed_size(size, response.url)
+            yield chunk
+    finally:
+        response.release()
+
+
+def _disk_cache_path(cache_key: Hashable) -> Path:
+    """附件在磁盘缓存中的文件路径"""
+    digest = hashlib.sha1(repr(cache_key).encode(), usedforsecurity=False).hexdigest()
+    return _cache_dir / f"{digest}.bin"
+
+
+async def _open_disk_cache_temp_file() -> BinaryIO | None:
+    """在磁盘缓存目录中创建临时文件，目录不可用时返回 None"""
+    if _cache_dir is None:
+        return None
+    try:
+        return await asyncio.to_thread(
+            tempfile.NamedTemporaryFile,
+            suffix=".tmp",
+            dir=_cache_dir,
+            delete=False
+        )
+    except OSError as e:
+        logger.warning(f"无法创建磁盘缓存文件，附件将不缓存: {e}")
+        return None
+
+
+async def _stream_and_cache_body(
+    response: aiohttp.ClientResponse,
+    cache_key: tuple[str, str],
+    entry: dict[str, Any],
+    temp_file: BinaryIO
+) -> AsyncIterator[bytes]:
+    """逐块转发上游响应体并写入临时文件，完整接收后登记到磁盘缓存
+
+    写入文件在线程中进行，不阻塞事件循环；写入失败时继续转发但不缓存。
+    """
+    temp_path = Path(temp_file.name)
+    size = 0
+    caching = True
+    complete = False
+    try:
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+            size += len(chunk)
+            _check_streamed_size(size, response.url)
+            if caching:
+                try:
+                    await asyncio.to_thread(temp_file.write, chunk)
+                except OSError as e:
+                    logger.warning(f"写入磁盘缓存失败，继续转发但不缓存: {e}")
+                    caching = False
+            yield chunk
+        if caching:
+            try:
+                await asyncio.to_thread(temp_file.flush)
+            except OSError as e:
+                logger.warning(f"写入磁盘缓存失败，不缓存: {e}")
+                caching = False
+        complete = True
+    finally:
+        response.release()
+        try:
+            temp_file.close()
+        except OSError:
+            caching = False
+        if complete and caching and _cache_dir is not None:
+            _store_disk_cache_entry(cache_key, entry, temp_path, size)
+        else:
+            temp_path.unlink(missing_ok=True)
+
+
+def _store_disk_cache_entry(
+    cache_key: tuple[str, str],
+    entry: dict[str, Any],
+    temp_path: Path,
+    size: int
+) -> None:
+    """将完整接收的临时文件登记到磁盘缓存"""
+    # 先移除旧条目，避免淘汰旧条目时删除新写入的文件；
+    # 同时移除内存缓存中的旧版本，否则后续请求会先命中它
+    disk_cache.pop(cache_key, None)
+    cache.pop(cache_key, None)
+    path = _disk_cache_path(cache_key)
+    try:
+        os.replace(temp_path, path)
+    except OSError as e:
+        temp_path.unlink(missing_ok=True)
+        logger.warning(f"无法保存磁盘缓存文件，附件将不缓存: {e}")
+        return
+    try:
+        disk_cache[cache_key] = {
+            **entry,
+            "path": path,
+            "size": size,
+            "fetched_at": time.monotonic()
+        }
+    except ValueError:
+        path.unlink(missing_ok=True)
+        logger.warning(f"附件超出磁盘缓存预算，不缓存: {cache_key[1]}")
+
+
+def _etag_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """检查客户端的 If-None-Match 是否与 ETag 匹配"""
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def _stream_file(file: BinaryIO) -> AsyncIterator[bytes]:
+    """在线程中逐块读取已打开的文件，发送完毕后关闭文件"""
+    try:
+        while chunk := await asyncio.to_thread(file.read, STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+async def _cached_attachment_response(
+    cached_data: dict[str, Any],
+    if_none_match: str | None
+) -> Response | None:
+    """从缓存条目构建响应，客户端缓存仍有效时返回 304
+
+    磁盘缓存的文件在响应前打开，之后被淘汰删除也不影响发送；
+    文件已不存在时返回 None，由调用方按未命中处理。
+    """
+    if _etag_matches(if_none_match, cached_data["etag"]):
+        return Response(status_code=304, headers=cached_data["headers"])
+    if "path" in cached_data:
+        try:
+            file = await asyncio.to_thread(open, cached_data["path"], "rb")
+        except OSError:
+            return None
+        return StreamingResponse(
+            _stream_file(file),
+            media_type=cached_data["content_type"],
+            headers={
+                **cached_data["headers"],
+                "Content-Length": str(os.fstat(file.fileno()).st_size)
+            }
+        )
+    return Response(
+        content=cached_data["content"],
+        media_type=cached_data["content_type"],
+        headers=cached_data["headers"]
+    )
+
+
+def _drop_missing_disk_entry(
+    cache_key: tuple[str, str],
+    cached_data: dict[str, Any]
+) -> None:
+    """移除文件已被删除的磁盘缓存条目，条目已被替换时保留新条目"""
+    logger.info(f"磁盘缓存文件已不存在，重新获取附件: {cache_key[1]}")
+    if disk_cache.get(cache_key) is cached_data:
+        del disk_cache[cache_key]
+
 
 @app.get("/health")
 async def health_check():
@@ -55,34 +550,90 @@ async def health_check():
 
 
 @app.get(f"{PROXY_BASE_PATH}/confluence/attachment/{{page_id}}/{{attachment_id}}")
-async def proxy_confluence_attachment(page_id: str, attachment_id: str):
+async def proxy_confluence_attachment(
+    page_id: str, attachment_id: str, request: Request
+) -> Response:
     """代理 Confluence 附件下载"""
-    if not CONFLUENCE_URL or not CONFLUENCE_USERNAME or not CONFLUENCE_API_TOKEN:
+    if not _CONFLUENCE_CONFIGURED:
         raise HTTPException(status_code=503, detail="Confluence 配置不完整")
 
-    cache_key = f"confluence_attachment_{page_id}_{attachment_id}"
-
-    # 检查缓存
-    if cache_key in cache:
-        logger.info(f"从缓存返回附件: {attachment_id}")
-        cached_data = cache[cache_key]
-        return Response(
-            content=cached_data["content"],
-            media_type=cached_data["content_type"],
-            headers=cached_data["headers"]
-        )
+    cache_key = (page_id, attachment_id)
+
+    # 相同附件正在获取时等待其完成，然后从缓存返回；
+    # 获取失败时返回相同的错误，不再各自请求上游
+    inflight = _INFLIGHT.get(cache_key)
+    if inflight is not None:
+        error = await asyncio.shield(inflight)
+        if error is not None:
+            raise HTTPException(status_code=error.status_code, detail=error.detail)
+
+    if_none_match = request.headers.get("if-none-match")
+
+    # 检查缓存，超过新鲜期的条目需要向上游重新验证
+    stale_data = None
+    cached_data = cache.get(cache_key)
+    if cached_data is None:
+        cached_data = disk_cache.get(cache_key)
+    if cached_data is not None:
+        if time.monotonic() - cached_data["fetched_at"] < ATTACHMENT_FRESH_TTL:
+            cached_response = await _cached_attachment_response(
+                cached_data, if_none_match
+            )
+            if cached_response is not None:
+                logger.info(f"从缓存返回附件: {attachment_id}")
+                return cached_response
+            _drop_missing_disk_entry(cache_key, cached_data)
+        elif cached_data["etag"] or cached_data["last_modified"]:
+            stale_data = cached_data
+
+    if cache_key in missing_cache:
+        raise HTTPException(status_code=404, detail="附件未找到")
+
+    fut = asyncio.get_running_loop().create_future()
+    _INFLIGHT[cache_key] = fut
+    error = None
 
     try:
         # 构建原始 Confluence 附件 URL
-        base_url = CONFLUENCE_URL.rstrip('/')
-        attachment_url = f"{base_url}/download/attachments/{page_id}/{attachment_id}"
-
-        # 创建认证
-        auth = aiohttp.BasicAuth(CONFLUENCE_USERNAME, CONFLUENCE_API_TOKEN)
+        attachment_url = _DL_PREFIX + page_id + "/" + attachment_id
+
+        # 已缓存的附件发送条件请求，未变化时上游只返回 304
+        conditional_headers = {}
+        if stale_data is not None:
+            if stale_data["etag"]:
+                conditional_headers["If-None-Match"] = stale_data["etag"]
+            if stale_data["last_modified"]:
+                conditional_headers["If-Modified-Since"] = stale_data["last_modified"]
+
+        # 限制并发的上游请求；流式返回的附件在获取响应头后即释放名额，
+        # 其响应体的传输由连接池的连接数上限约束
+        async with _UPSTREAM_SEM:
+            # 响应流式返回时由 _stream_body 负责释放连接
+            response = await _upstream_get(
+                SESSION_CONFLUENCE, attachment_url, conditional_headers
+            )
+            streaming = False
+            try:
+                if response.status == 304 and stale_data is not None:
+                    cached_response = await _cached_attachment_response(
+                        stale_data, if_none_match
+                    )
+                    if cached_response is not None:
+                        target_cache = disk_cache if "path" in stale_data else cache
+                        target_cache[cache_key] = {
+                            **stale_data, "fetched_at": time.monotonic()
+                        }
+                        logger.info(f"附件未变化，从缓存返回: {attachment_id}")
+                        return cached_response
+                    # 缓存文件已被删除，不带条件头重新获取完整内容
+                    _drop_missing_disk_entry(cache_key, stale_data)
+                    response.release()
+                    response = await _upstream_get(
+                        SESSION_CONFLUENCE, attachment_url
+                    )
 
-        async with aiohttp.ClientSession(auth=auth) as session:
-            async with session.get(attachment_url) as response:
                 if response.status == 404:
+                    missing_cache[cache_key] = True
                     raise HTTPException(status_code=404, detail="附件未找到")
                 elif response.status != 200:
                     raise HTTPException(
@@ -90,9 +641,6 @@ async def proxy_confluence_attachment(page_id: str, attachment_id: str):
                         detail=f"获取附件失败: {response.reason}"
                     )
 
-                # 读取内容
-                content = await response.read()
-
                 # 确定内容类型
                 content_type = response.headers.get('content-type')
                 if not content_type:
@@ -104,18 +652,58 @@ async def proxy_confluence_attachment(page_id: str, attachment_id: str):
                         content_type, _ = mimetypes.guess_type(filename)
                     content_type = content_type or 'application/octet-stream'
 
-                # 准备响应头
+                # 准备响应头，转发 ETag 使浏览器也能重新验证
+                etag = response.headers.get('etag')
+                last_modified = response.headers.get('last-modified')
                 response_headers = {
                     "Content-Disposition": response.headers.get('content-disposition', 'inline'),
                     "Cache-Control": "public, max-age=3600"
                 }
+                if etag:
+                    response_headers["ETag"] = etag
+                if last_modified:
+                    response_headers["Last-Modified"] = last_modified
+
+                # 大小未知或较大的附件流式返回，同时写入磁盘缓存
+                _check_content_length(response)
+                content_length = response.content_length
+                if content_length is None or content_length >= CACHE_MAX_CONTENT_LENGTH:
+                    logger.info(f"流式代理附件: {attachment_id}")
+                    # 在发送响应头前创建临时文件，无法创建时只转发不缓存
+                    temp_file = await _open_disk_cache_temp_file()
+                    streaming = True
+                    if temp_file is not None:
+                        body = _stream_and_cache_body(response, cache_key, {
+                            "content_type": content_type,
+                            "headers": response_headers,
+                            "etag": etag,
+                            "last_modified": last_modified
+                        }, temp_file)
+                    else:
+                        body = _stream_body(response)
+                    return StreamingResponse(
+                        body,
+                        media_type=content_type,
+                        headers=response_headers
+                    )
 
-                # 缓存结果
-                cache[cache_key] = {
-                    "content": content,
-                    "content_type": content_type,
-                    "headers": response_headers
-                }
+                # 读取内容，解压后超过 MAX_BODY 时返回 413
+                content = await _read_body(response)
+
+                # 缓存结果，超出缓存预算的附件不缓存；
+                # 附件变小时移除磁盘缓存中的旧版本
+                disk_cache.pop(cache_key, None)
+                try:
+                    cache[cache_key] = {
+                        "content": content,
+                        "content_type": content_type,
+                        "headers": response_headers,
+                        "etag": etag,
+                        "last_modified": last_modified,
+                        "fetched_at": time.monotonic()
+                    }
+                except ValueError:
+                    logger.warning(f"附件超出缓存预算，不缓存: {attachment_id}")
 
                 logger.info(f"成功代理附件: {attachment_id}")
                 return Response(
@@ -123,31 +711,64 @@ async def proxy_confluence_attachment(page_id: str, attachment_id: str):
                     media_type=content_type,
                     headers=response_headers
                 )
+            finally:
+                if not streaming:
+                    response.release()
 
+    except HTTPException as e:
+        error = e
+        raise
     except aiohttp.ClientError as e:
         logger.error(f"网络错误获取附件 {attachment_id}: {e}")
-        raise HTTPException(status_code=502, detail="获取附件失败")
+        error = HTTPException(status_code=502, detail="获取附件失败")
+        raise error
     except Exception as e:
         logger.error(f"意外错误获取附件 {attachment_id}: {e}")
-        raise HTTPException(status_code=500, detail="内部服务器错误")
+        error = HTTPException(status_code=500, detail="内部服务器错误")
+        raise error
+    finally:
+        # 唤醒等待同一附件的请求，并告知获取失败时的错误
+        if _INFLIGHT.get(cache_key) is fut:
+            del _INFLIGHT[cache_key]
+        fut.set_result(error)
 
 
 @app.get(f"{PROXY_BASE_PATH}/confluence/page/{{page_id}}")
-async def get_confluence_page_with_proxy_links(page_id: str, request: Request):
+async def get_confluence_page_with_proxy_links(
+    page_id: str, request: Request
+) -> Response:
     """获取 Confluence 页面内容，并替换附件链接为代理链接"""
-    if not CONFLUENCE_URL or not CONFLUENCE_USERNAME or not CONFLUENCE_API_TOKEN:
+    if not _CONFLUENCE_CONFIGURED:
         raise HTTPException(status_code=503, detail="Confluence 配置不完整")
 
+    proxy_base_url = f"{request.url.scheme}://{request.url.netloc}{PROXY_BASE_PATH}"
+    cache_key = (page_id, proxy_base_url)
+
     try:
-        # 构建 Confluence API URL
-        base_url = CONFLUENCE_URL.rstrip('/')
-        api_url = f"{base_url}/rest/api/content/{page_id}?expand=body.storage,version,space,children.attachment"
+        # 缓存命中时只获取版本号，版本未变化则直接返回缓存的页面
+        cached_page = page_cache.get(cache_key)
+        if cached_page is not None:
+            version_url = _CONTENT_API_PREFIX + page_id + "?expand=version"
+            async with _UPSTREAM_SEM:
+                async with await _upstream_get(
+                    SESSION_CONFLUENCE, version_url
+                ) as response:
+                    version_data = None
+                    if response.status == 200:
+                        version_data = orjson.loads(await _read_body(response))
+            version = (version_data or {}).get("version", {}).get("number")
+            if version is not None and version == cached_page["version"]:
+                page_cache[cache_key] = cached_page
+                logger.info(f"页面未变化，从缓存返回: {page_id}")
+                return Response(
+                    content=cached_page["body"], media_type="application/json"
+                )
 
-        # 创建认证
-        auth = aiohttp.BasicAuth(CONFLUENCE_USERNAME, CONFLUENCE_API_TOKEN)
+        # 构建 Confluence API URL
+        api_url = _CONTENT_API_PREFIX + page_id + "?expand=body.storage,version,space,children.attachment"
 
-        async with aiohttp.ClientSession(auth=auth) as session:
-            async with session.get(api_url) as response:
+        async with _UPSTREAM_SEM:
+            async with await _upstream_get(SESSION_CONFLUENCE, api_url) as response:
                 if response.status == 404:
                     raise HTTPException(status_code=404, detail="页面未找到")
                 elif response.status != 200:
@@ -156,32 +777,42 @@ async def get_confluence_page_with_proxy_links(page_id: str, request: Request):
                         detail=f"获取页面失败: {response.reason}"
                     )
 
-                page_data = await response.json()
+                # 页面正文可能有数 MB，使用 orjson 解析
+                page_data = orjson.loads(await _read_body(response))
 
-                # 获取页面内容
-                content = page_data.get("body", {}).get("storage", {}).get("value", "")
+        # 获取页面内容
+        content = page_data.get("body", {}).get("storage", {}).get("value", "")
 
-                # 获取附件列表
-                attachments = page_data.get("children", {}).get("attachment", {}).get("results", [])
+        # 获取附件列表
+        attachments = page_data.get("children", {}).get("attachment", {}).get("results", [])
 
-                # 替换附件链接为代理链接
-                proxy_base_url = f"{request.url.scheme}://{request.url.netloc}{PROXY_BASE_PATH}"
-                modified_content = replace_attachment_links(content, page_id, proxy_base_url, base_url, attachments)
+        # 替换附件链接为代理链接
+        modified_content = replace_attachment_links(content, page_id, proxy_base_url, _CONFLUENCE_BASE, attachments)
 
-                # 返回修改后的页面数据
-                result = {
-                    "id": page_data.get("id"),
-                    "title": page_data.get("title"),
-                    "content": modified_content,
-                    "space": page_data.get("space", {}),
-                    "version": page_data.get("version", {}),
-                    "type": page_data.get("type"),
-                    "_links": page_data.get("_links", {})
-                }
+        # 返回修改后的页面数据
+        result = {
+            "id": page_data.get("id"),
+            "title": page_data.get("title"),
+            "content": modified_content,
+            "space": page_data.get("space", {}),
+            "version": page_data.get("version", {}),
+            "type": page_data.get("type"),
+            "_links": page_data.get("_links", {})
+        }
 
-                logger.info(f"成功获取页面: {page_id}")
-                return result
+        # 直接用 orjson 序列化，缓存命中时复用序列化后的结果
+        body = orjson.dumps(result)
 
+        # 缓存结果及其版本号，没有版本号时无法验证，不缓存
+        version = result["version"].get("number")
+        if version is not None:
+            page_cache[cache_key] = {"version": version, "body": body}
+
+        logger.info(f"成功获取页面: {page_id}")
+        return Response(content=body, media_type="application/json")
+
+    except HTTPException:
+        raise
     except aiohttp.ClientError as e:
         logger.error(f"网络错误获取页面 {page_id}: {e}")
         raise HTTPException(status_code=502, detail="获取页面失败")
@@ -190,36 +821,72 @@ async def get_confluence_page_with_proxy_links(page_id: str, request: Request):
         raise HTTPException(status_code=500, detail="内部服务器错误")
 
 
+def _is_allowed_general_host(hostname: str) -> bool:
+    """检查通用代理是否允许访问该主机，防止被用于访问内网服务
+
+    域名解析到的地址由 PublicAddressResolver 在连接时检查。
+    """
+    if PROXY_ALLOWED_HOSTS:
+        return hostname in PROXY_ALLOWED_HOSTS
+    if hostname == "localhost":
+        return False
+    try:
+        address = ipaddress.ip_address(hostname)
+    except ValueError:
+        return True
+    return address.is_global
+
+
+def _check_general_url(url: str) -> None:
+    """只代理 http/https 且允许访问的主机"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise HTTPException(status_code=400, detail="无效的 URL")
+    if not _is_allowed_general_host(parsed.hostname):
+        raise HTTPException(status_code=403, detail="不允许代理该主机")
+
+
 @app.get(f"{PROXY_BASE_PATH}/general/{{path:path}}")
-async def proxy_general(path: str):
+async def proxy_general(path: str) -> Response:
     """代理通用 URL"""
     try:
         # 解码 URL
-        from urllib.parse import unquote, urlparse
         url = unquote(path)
 
-        # 验证 URL
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            raise HTTPException(status_code=400, detail="无效的 URL")
+        # 手动跟随重定向，每一跳都重新验证目标 URL
+        for _ in range(MAX_GENERAL_REDIRECTS + 1):
+            _check_general_url(url)
+            response = await _upstream_get(
+                SESSION_GENERAL, url, allow_redirects=False
+            )
+            location = response.headers.get("Location")
+            if response.status not in _REDIRECT_STATUSES or not location:
+                break
+            response.release()
+            url = urljoin(url, location)
+        else:
+            raise HTTPException(status_code=502, detail="重定向次数过多")
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                content = await response.read()
+        _check_content_length(response)
 
-                # 返回内容，保留原始头部
-                response_headers = {
-                    "Content-Type": response.headers.get("Content-Type", "application/octet-stream"),
-                    "Cache-Control": "public, max-age=3600"
-                }
+        # 响应体由 _stream_body 流式转发并在结束后释放连接
+        # 返回内容，保留原始头部
+        response_headers = {
+            "Content-Type": response.headers.get("Content-Type", "application/octet-stream"),
+            "Cache-Control": "public, max-age=3600"
+        }
 
-                return Response(
-                    content=content,
-                    headers=response_headers,
-                    status_code=response.status
-                )
+        return StreamingResponse(
+            _stream_body(response),
+            headers=response_headers,
+            status_code=response.status
+        )
 
+    except HTTPException:
+        raise
     except aiohttp.ClientError as e:
+        if isinstance(getattr(e, "os_error", None), DisallowedAddressError):
+            raise HTTPException(status_code=403, detail="不允许代理该主机")
         logger.error(f"网络错误代理 URL {path}: {e}")
         raise HTTPException(status_code=502, detail="代理失败")
     except Exception as e:
@@ -227,34 +894,65 @@ async def proxy_general(path: str):
         raise HTTPException(status_code=500, detail="内部服务器错误")
 
 
-def replace_attachment_links(content: str, page_id: str, proxy_base_url: str, confluence_base_url: str, attachments: list) -> str:
-    """替换内容中的附件链接为代理链接"""
-
-    # 创建文件名到附件ID的映射
-    attachment_map = {att.get("title", ""): att.get("id", "") for att in attachments}
+# 附件链接的相对路径模式 /download/attachments/pageId/filename
+_ATTACHMENT_PATH_PATTERN = r'/download/attachments/(\d+)/([^)\s"\']+)'
 
-    # 模式1: 相对路径 /download/attachments/pageId/filename
-    pattern1 = r'/download/attachments/(\d+)/([^)\s"\']+)'
 
-    def replace_relative_link(match):
-        matched_page_id = match.group(1)
-        filename = unquote(match.group(2))
-        if filename in attachment_map:
-            attachment_id = attachment_map[filename]
-            return f"{proxy_base_url}/confluence/attachment/{matched_page_id}/{attachment_id}"
-        else:
-            logger.warning(f"附件未找到: {filename}")
-            return match.group(0)
+@functools.lru_cache(maxsize=16)
+def _pattern_combined(confluence_base_url: str) -> re.Pattern[str]:
+    """编译并缓存同时匹配相对路径和完整 URL 的附件链接模式"""
+    return re.compile(
+        f"(?:{re.escape(confluence_base_url)})?{_ATTACHMENT_PATH_PATTERN}"
+    )
 
-    content = re.sub(pattern1, replace_relative_link, content)
 
-    # 模式2: 完整 URL https://domain/download/attachments/pageId/filename
-    confluence_base_escaped = re.escape(confluence_base_url)
-    pattern2 = rf'{confluence_base_escaped}/download/attachments/(\d+)/([^)\s"\']+)'
+def replace_attachment_links(content: str, page_id: str, proxy_base_url: str, confluence_base_url: str, attachments: list) -> str:
+    """替换内容中的附件链接为代理链接"""
 
-    content = re.sub(pattern2, replace_relative_link, content)
+    # 页面没有附件或没有附件链接时无需替换
+    if not attachments or "/download/attachments/" not in content:
+        return content
+
+    # 创建文件名到附件ID的映射，跳过缺少标题或ID的附件
+    attachment_map = {
+        title: attachment_id
+        for att in attachments
+        if (title := att.get("title")) and (attachment_id := att.get("id"))
+    }
+    if not attachment_map:
+        return content
+
+    # 同名附件只保留最后一个，记录一次被覆盖的文件名
+    if len(attachment_map) < len(attachments):
+        seen = set()
+        duplicates = set()
+        for att in attachments:
+            title = att.get("title")
+            if title in seen:
+                duplicates.add(title)
+            seen.add(title)
+        duplicates.discard(None)
+        if duplicates:
+            logger.warning(
+                f"页面 {page_id} 存在同名附件，链接指向最后一个: {sorted(duplicates)}"
+            )
+
+    # 每个匹配都会用到的查找方法和代理 URL 前缀，只计算一次
+    get_attachment_id = attachment_map.get
+    proxy_prefix = f"{proxy_base_url}/confluence/attachment/"
+
+    def replace_relative_link(match: re.Match[str]) -> str:
+        filename = unquote(match.group(2))
+        attachment_id = get_attachment_id(filename)
+        if attachment_id:
+            return proxy_prefix + match.group(1) + "/" + attachment_id
+        logger.warning(f"附件未找到: {filename}")
+        return match.group(0)
 
-    return content
+    # 一次替换两种形式的链接:
+    # 相对路径 /download/attachments/pageId/filename
+    # 完整 URL https://domain/download/attachments/pageId/filename
+    return _pattern_combined(confluence_base_url).sub(replace_relative_link, content)
 
 
 def main():
@@ -270,12 +968,24 @@ def main():
     # 启动服务器
     host = os.getenv("PROXY_HOST", "0.0.0.0")
     port = int(os.getenv("PROXY_PORT", "8080"))
+    workers = int(os.getenv("PROXY_WORKERS", "1"))
     
     logger.info(f"启动 Atlassian 代理服务: {host}:{port}")
     logger.info(f"代理基础路径: {PROXY_BASE_PATH}")
     logger.info(f"Confluence URL: {CONFLUENCE_URL}")
+    logger.info(f"工作进程数: {workers}")
     
-    uvicorn.run(app, host=host, port=port)
+    # 安装了 uvloop 和 httptools 时 uvicorn 会自动使用它们；
+    # 多进程模式需要以导入字符串的形式传入应用
+    uvicorn.run(
+        "standalone_proxy:app" if workers > 1 else app,
+        host=host,
+        port=port,
+        loop="auto",
+        http="auto",
+        access_log=False,
+        workers=workers
+    )
 
 
 if __name__ == "__main__":
@@ -89,6 +89,140 @@ def test_process_html_content_basic(preprocessor_with_confluence):
     assert processed_markdown.strip() == "Simple text"
 
 
+def test_process_html_content_without_macros_skips_parsing(
+    preprocessor_with_confluence,
+):
+    """Test that content without ac:/ri: elements is converted directly."""
+    from unittest.mock import patch
+
+    html = "<h1>Title</h1><p>Plain <strong>prose</strong></p>"
+    with patch.object(preprocessor_with_confluence, "_parse_html") as mock_parse:
+        processed_html, processed_markdown = (
+            preprocessor_with_confluence.process_html_content(
+                html, confluence_client=MockConfluenceClient()
+            )
+        )
+
+    mock_parse.assert_not_called()
+    assert processed_html == html
+    assert "Plain **prose**" in processed_markdown
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "  <b> spaced </b>  ",
+        "\n<p>First</p>\n<p>Second</p>\n\n",
+        "\t <h1>Title</h1>\n<p>Body</p> \n ",
+    ],
+)
+def test_process_html_content_fast_path_matches_parsed_path(
+    preprocessor_with_confluence, html
+):
+    """Test that padded content without macros trims like the parsed path."""
+    from unittest.mock import patch
+
+    fast_html, fast_markdown = preprocessor_with_confluence.process_html_content(
+        html, confluence_client=MockConfluenceClient()
+    )
+
+    # Take the parsed path, then parse the content as plain HTML as it would
+    # be without the fast path
+    with patch(
+        "mcp_atlassian.preprocessing.base._has_storage_format_elements",
+        side_effect=[True, False],
+    ):
+        parsed_html, parsed_markdown = (
+            preprocessor_with_confluence.process_html_content(
+                html, confluence_client=MockConfluenceClient()
+            )
+        )
+
+    assert fast_html == parsed_html
+    assert fast_markdown == parsed_markdown
+
+
+def test_process_html_content_without_markdown(preprocessor_with_confluence):
+    """Test that markdown conversion is skipped when it is not needed."""
+    html = """
+    <p>Hello <ac:link><ri:user ri:account-id="123456"/></ac:link></p>
+    """
+    processed_html, processed_markdown = (
+        preprocessor_with_confluence.process_html_content(
+            html, confluence_client=MockConfluenceClient(), needs_markdown=False
+        )
+    )
+
+    assert "@Test User 123456" in processed_html
+    assert processed_markdown == ""
+
+
+def test_process_html_content_preserves_fragment(preprocessor_with_confluence):
+    """Test that the parser does not add document wrappers or drop CDATA."""
+    html = (
+        "<p>Intro</p>"
+        '<ac:structured-macro ac:name="code"><ac:plain-text-body>'
+        '<![CDATA[print("<b>")]]>'
+        "</ac:plain-text-body></ac:structured-macro>"
+    )
+    processed_html, processed_markdown = (
+        preprocessor_with_confluence.process_html_content(
+            html, confluence_client=MockConfluenceClient()
+        )
+    )
+
+    assert "<html>" not in processed_html
+    assert "<body>" not in processed_html
+    assert 'print("<b>")' in processed_markdown
+
+
+@pytest.mark.parametrize(
+    "macro",
+    [
+        '<ac:link><ri:user ri:account-id="123456"/></ac:link>',
+        '<ac:image><ri:attachment ri:filename="y.png"/>'
+        "<ac:caption><p>Caption</p></ac:caption></ac:image>",
+    ],
+)
+def test_process_html_content_keeps_entities_in_cdata(
+    preprocessor_with_confluence, macro
+):
+    """Test that named entities inside code macro CDATA are left unchanged."""
+    html = (
+        f"<p>a&nbsp;b</p>{macro}"
+        '<ac:structured-macro ac:name="code"><ac:plain-text-body>'
+        "<![CDATA[<td>a&nbsp;b&copy;</td>]]>"
+        "</ac:plain-text-body></ac:structured-macro>"
+    )
+    _, processed_markdown = preprocessor_with_confluence.process_html_content(
+        html,
+        confluence_client=MockConfluenceClient(),
+        page_id="1",
+        preserve_inline_attachments=True,
+    )
+
+    assert "<td>a&nbsp;b&copy;</td>" in processed_markdown
+    assert "&#160;" not in processed_markdown
+
+
+def test_process_storage_format_malformed_xml(preprocessor_with_confluence):
+    """Test that storage format which is not well-formed XML still parses."""
+    html = (
+        "<p>Unclosed paragraph&nbsp;here"
+        '<ac:link><ri:user ri:account-id="123456"/></ac:link>'
+        "<p>Second <br> line</p>"
+    )
+    processed_html, processed_markdown = (
+        preprocessor_with_confluence.process_html_content(
+            html, confluence_client=MockConfluenceClient()
+        )
+    )
+
+    assert "@Test User 123456" in processed_markdown
+    assert "Second" in processed_markdown
+    assert "line" in processed_markdown
+
+
 def test_process_html_content_with_user_mentions(preprocessor_with_confluence):
     """Test HTML content processing with user mentions."""
     html = """
@@ -107,6 +241,131 @@ def test_process_html_content_with_user_mentions(preprocessor_with_confluence):
     assert "@Test User 123456" in processed_markdown
 
 
+def test_process_html_content_with_user_mention_link_body(
+    preprocessor_with_confluence,
+):
+    """Test that user mentions with an ac:link-body are replaced as well."""
+    html = """
+    <ac:link>
+        <ri:user ri:account-id="123456"/>
+        <ac:link-body>@someone</ac:link-body>
+    </ac:link>
+    """
+    processed_html, processed_markdown = (
+        preprocessor_with_confluence.process_html_content(
+            html, confluence_client=MockConfluenceClient()
+        )
+    )
+
+    assert "@Test User 123456" in processed_markdown
+    assert "@someone" not in processed_markdown
+
+
+def test_process_html_content_looks_up_each_user_once(preprocessor_with_confluence):
+    """Test that repeated mentions of a user trigger a single lookup."""
+    from unittest.mock import MagicMock
+
+    client = MagicMock()
+    client.get_user_details_by_accountid.side_effect = lambda account_id: {
+        "displayName": f"User {account_id}"
+    }
+    html = (
+        '<p><ac:link><ri:user ri:account-id="a1"/></ac:link> and '
+        '<ac:link><ri:user ri:account-id="a2"/></ac:link> and '
+        '<ac:link><ri:user ri:account-id="a1"/></ac:link></p>'
+        '<ac:structured-macro ac:name="profile"><ac:parameter ac:name="user">'
+        '<ri:user ri:account-id="a2"/></ac:parameter></ac:structured-macro>'
+    )
+
+    processed_html, processed_markdown = (
+        preprocessor_with_confluence.process_html_content(
+            html, confluence_client=client
+        )
+    )
+
+    assert processed_markdown.count("@User a1") == 2
+    assert processed_markdown.count("@User a2") == 2
+    assert sorted(
+        call.args[0] for call in client.get_user_details_by_accountid.call_args_list
+    ) == ["a1", "a2"]
+
+
+def test_process_html_content_caches_users_across_pages(
+    preprocessor_with_confluence,
+):
+    """Test that user lookups are cached across pages for the same client."""
+    from unittest.mock import MagicMock
+
+    def get_user(account_id):
+        if account_id == "missing":
+            raise Exception("User not found")
+        return {"displayName": f"User {account_id}"}
+
+    client = MagicMock()
+    client.get_user_details_by_accountid.side_effect = get_user
+    html = (
+        '<p><ac:link><ri:user ri:account-id="a1"/></ac:link> and '
+        '<ac:link><ri:user ri:account-id="missing"/></ac:link></p>'
+    )
+
+    for _ in range(2):
+        _, processed_markdown = preprocessor_with_confluence.process_html_content(
+            html, confluence_client=client
+        )
+        assert "@User a1" in processed_markdown
+        assert "@user\\_missing" in processed_markdown
+
+    assert client.get_user_details_by_accountid.call_count == 2
+
+    # A different client does not reuse the cached results
+    other_client = MagicMock()
+    other_client.get_user_details_by_accountid.return_value = {"displayName": "Other"}
+    preprocessor_with_confluence.process_html_content(
+        html, confluence_client=other_client
+    )
+    assert other_client.get_user_details_by_accountid.call_count == 2
+
+
+def test_process_html_content_retries_failed_user_lookups(
+    preprocessor_with_confluence, monkeypatch
+):
+    """Test that failed user lookups are retried once their TTL has passed."""
+    from unittest.mock import MagicMock
+
+    from mcp_atlassian.preprocessing import base
+
+    client = MagicMock()
+    client.get_user_details_by_accountid.side_effect = TimeoutError("timed out")
+    html = '<p><ac:link><ri:user ri:account-id="a1"/></ac:link></p>'
+
+    _, processed_markdown = preprocessor_with_confluence.process_html_content(
+        html, confluence_client=client
+    )
+    assert "@user\\_a1" in processed_markdown
+
+    # Failures are cached without the exception and its traceback
+    assert not any(
+        isinstance(value, BaseException)
+        for value in preprocessor_with_confluence._user_cache.values()
+    )
+
+    # Within the TTL the failure is served from the cache
+    preprocessor_with_confluence.process_html_content(html, confluence_client=client)
+    assert client.get_user_details_by_accountid.call_count == 1
+
+    # After the TTL the lookup is retried and can succeed
+    monkeypatch.setattr(base, "USER_LOOKUP_FAILURE_TTL", 0.0)
+    preprocessor_with_confluence._user_cache.clear()
+    preprocessor_with_confluence.process_html_content(html, confluence_client=client)
+    client.get_user_details_by_accountid.side_effect = None
+    client.get_user_details_by_accountid.return_value = {"displayName": "User a1"}
+    _, processed_markdown = preprocessor_with_confluence.process_html_content(
+        html, confluence_client=client
+    )
+    assert "@User a1" in processed_markdown
+    assert client.get_user_details_by_accountid.call_count == 3
+
+
 def test_clean_jira_text_empty(preprocessor_with_jira):
     """Test cleaning empty Jira text."""
     assert preprocessor_with_jira.clean_jira_text("") == ""
@@ -416,6 +675,35 @@ def test_process_user_profile_macro_multiple():
     assert "@Test User Two" in processed_markdown
 
 
+def test_markdown_to_confluence_fallback_converts_markdown_once():
+    """Test that the fallback path reuses the HTML converted from markdown."""
+    from unittest.mock import patch
+
+    from mcp_atlassian.preprocessing import confluence as confluence_module
+
+    preprocessor = confluence_module.ConfluencePreprocessor(
+        base_url="https://example.atlassian.net"
+    )
+
+    with (
+        patch.object(
+            confluence_module,
+            "markdown_to_html",
+            wraps=confluence_module.markdown_to_html,
+        ) as mock_markdown_to_html,
+        patch.object(
+            confluence_module,
+            "ConfluenceStorageFormatConverter",
+            side_effect=RuntimeError("conversion failed"),
+        ),
+    ):
+        result = preprocessor.markdown_to_confluence_storage("Some **bold** text")
+
+    mock_markdown_to_html.assert_called_once()
+    assert result.startswith("<p>")
+    assert "<strong>bold</strong>" in result
+
+
 def test_markdown_to_confluence_no_automatic_anchors():
     """Test that heading_anchors=False prevents automatic anchor generation (regression for issue #488)."""
     from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
@@ -617,6 +905,204 @@ def test_process_html_content_with_malformed_attachments():
     assert "[Attachment link]" in processed_html
 
 
+def test_inline_attachments_keep_following_content():
+    """Test that content after a self-closing ri:attachment is preserved."""
+    from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
+
+    html = (
+        '<p>See <ri:attachment ri:filename="readme.txt"/> for details.</p>'
+        "<p>Next paragraph</p>"
+    )
+
+    preprocessor = ConfluencePreprocessor(
+        base_url="https://example.atlassian.net", preserve_inline_attachments=True
+    )
+
+    processed_html, processed_markdown = preprocessor.process_html_content(
+        html, confluence_client=MockConfluenceClient(), page_id="12345"
+    )
+
+    assert "/confluence/attachment/12345/readme.txt\">readme.txt</a> for details." in (
+        processed_html
+    )
+    assert "<p>Next paragraph</p>" in processed_html
+    assert "<ri:attachment" not in processed_html
+
+
+def test_inline_attachments_in_malformed_storage_format():
+    """Test attachment rewriting when the content is not well-formed XML."""
+    from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
+
+    html = (
+        "<p>Line<br></p>"
+        '<ac:image><ri:attachment ri:filename="chart.png"/></ac:image>'
+        '<ac:link><ri:attachment ri:filename="doc.pdf"/>'
+        "<ac:link-body>Download</ac:link-body></ac:link>"
+        '<ri:attachment ri:filename="notes.txt"/>'
+    )
+
+    preprocessor = ConfluencePreprocessor(
+        base_url="https://example.atlassian.net", preserve_inline_attachments=True
+    )
+
+    processed_html, processed_markdown = preprocessor.process_html_content(
+        html, confluence_client=MockConfluenceClient(), page_id="12345"
+    )
+
+    assert "/confluence/attachment/12345/chart.png" in processed_html
+    assert "/confluence/attachment/12345/doc.pdf\">Download</a>" in processed_html
+    assert "/confluence/attachment/12345/notes.txt\">notes.txt</a>" in processed_html
+    assert "ri:attachment" not in processed_html
+
+
+def test_quote_attachment_filename_matches_quote():
+    """Test that the ASCII fast path encodes exactly like urllib's quote."""
+    from urllib.parse import quote
+
+    from mcp_atlassian.preprocessing.base import quote_attachment_filename
+
+    ascii_chars = "".join(chr(code) for code in range(128))
+    for filename in [ascii_chars, "my file (v2).png", "café menü.pdf", "a/b?c#d"]:
+        assert quote_attachment_filename(filename) == quote(filename)
+
+
+def test_inline_attachments_skipped_without_attachment_references():
+    """Test that the attachment stage is skipped when nothing references one."""
+    from unittest.mock import patch
+
+    from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
+
+    html = (
+        '<p><ac:link><ri:user ri:account-id="123456"/></ac:link></p>'
+        '<ac:image><ri:url ri:value="https://example.com/logo.png"/></ac:image>'
+    )
+
+    preprocessor = ConfluencePreprocessor(
+        base_url="https://example.atlassian.net", preserve_inline_attachments=True
+    )
+
+    with (
+        patch(
+            "mcp_atlassian.preprocessing.confluence._rewrite_attachments_regex"
+        ) as mock_regex,
+        patch(
+            "mcp_atlassian.preprocessing.base._rewrite_attachments_lxml"
+        ) as mock_lxml,
+        patch.object(preprocessor, "_process_inline_attachments_in_soup") as mock_soup,
+    ):
+        processed_html, processed_markdown = preprocessor.process_html_content(
+            html, confluence_client=MockConfluenceClient(), page_id="12345"
+        )
+
+    mock_regex.assert_not_called()
+    mock_lxml.assert_not_called()
+    mock_soup.assert_not_called()
+    assert "@Test User 123456" in processed_markdown
+
+
+def test_inline_attachments_regex_fast_path():
+    """Test that simple attachment macros are rewritten without a tree pass."""
+    from unittest.mock import patch
+
+    from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
+
+    html = (
+        '<ac:image><ri:attachment ri:filename="chart.png"/>'
+        '<ac:parameter ac:name="alt">Q1 &amp; Q2</ac:parameter></ac:image>'
+        '<p><ac:link><ri:attachment ri:filename="doc.pdf"/>'
+        "<ac:link-body>Download</ac:link-body></ac:link></p>"
+    )
+
+    preprocessor = ConfluencePreprocessor(
+        base_url="https://example.atlassian.net", preserve_inline_attachments=True
+    )
+
+    with patch(
+        "mcp_atlassian.preprocessing.base._rewrite_attachments_lxml"
+    ) as mock_rewrite:
+        processed_html, processed_markdown = preprocessor.process_html_content(
+            html, confluence_client=MockConfluenceClient(), page_id="12345"
+        )
+
+    mock_rewrite.assert_not_called()
+    assert 'alt="Q1 &amp; Q2"' in processed_html
+    assert "/confluence/attachment/12345/doc.pdf\">Download</a>" in processed_html
+
+
+def test_inline_attachments_regex_skips_cdata():
+    """Test that attachment markup inside code macro CDATA is not rewritten."""
+    from unittest.mock import patch
+
+    from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
+
+    html = (
+        '<ac:image><ri:attachment ri:filename="chart.png"/></ac:image>'
+        '<ac:image><ri:url ri:value="https://example.com/logo.png"/></ac:image>'
+        '<ac:structured-macro ac:name="code"><ac:plain-text-body>'
+        '<![CDATA[<ri:attachment ri:filename="x.png"/>]]>'
+        "</ac:plain-text-body></ac:structured-macro>"
+    )
+
+    preprocessor = ConfluencePreprocessor(
+        base_url="https://example.atlassian.net", preserve_inline_attachments=True
+    )
+
+    with patch(
+        "mcp_atlassian.preprocessing.base._rewrite_attachments_lxml"
+    ) as mock_rewrite:
+        processed_html, processed_markdown = preprocessor.process_html_content(
+            html, confluence_client=MockConfluenceClient(), page_id="12345"
+        )
+
+    mock_rewrite.assert_not_called()
+    assert "/confluence/attachment/12345/chart.png" in processed_html
+    assert "/confluence/attachment/12345/x.png" not in processed_html
+    assert '<ri:attachment ri:filename="x.png"/>' in processed_markdown
+
+
+def test_inline_attachments_regex_strips_highlight_markers():
+    """Test that search highlight markers do not leak into attachment URLs."""
+    from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
+
+    html = (
+        '<ac:link><ri:attachment ri:filename="@@@hl@@@report@@@endhl@@@.pdf"/>'
+        "</ac:link>"
+    )
+
+    preprocessor = ConfluencePreprocessor(
+        base_url="https://example.atlassian.net", preserve_inline_attachments=True
+    )
+    processed_html, _ = preprocessor.process_html_content(
+        html, confluence_client=MockConfluenceClient(), page_id="12345"
+    )
+
+    assert "/confluence/attachment/12345/report.pdf" in processed_html
+    assert "@@@" not in processed_html
+    assert "%40%40%40" not in processed_html
+
+
+def test_inline_attachments_regex_falls_back_for_nested_macros():
+    """Test that attachment macros the regex cannot handle use the tree rewrite."""
+    from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
+
+    html = (
+        '<ac:image><ri:url ri:value="https://example.com/logo.png"/></ac:image>'
+        '<ac:link><ri:attachment ri:filename="spec.pdf">'
+        '<ri:page ri:content-title="Specs"/></ri:attachment></ac:link>'
+    )
+
+    preprocessor = ConfluencePreprocessor(
+        base_url="https://example.atlassian.net", preserve_inline_attachments=True
+    )
+
+    processed_html, processed_markdown = preprocessor.process_html_content(
+        html, confluence_client=MockConfluenceClient(), page_id="12345"
+    )
+
+    assert "<ac:image>" in processed_html
+    assert "/confluence/attachment/12345/spec.pdf\">spec.pdf</a>" in processed_html
+
+
 def test_attachment_url_encoding():
     """Test that attachment filenames are properly URL encoded."""
     from mcp_atlassian.preprocessing.confluence import ConfluencePreprocessor
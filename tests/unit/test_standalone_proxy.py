@@ -0,0 +1,706 @@
+"""Unit tests for the standalone attachment proxy."""
+
+import asyncio
+import errno
+import gzip
+import shutil
+import socket
+import time
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock
+from urllib.parse import quote
+
+import aiohttp
+import aiohttp.abc
+import httpx
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from cachetools import TTLCache
+
+import standalone_proxy
+from standalone_proxy import (
+    DisallowedAddressError,
+    PublicAddressResolver,
+    TTLLFUCache,
+    _is_allowed_general_host,
+    replace_attachment_links,
+)
+
+
+@asynccontextmanager
+async def proxy_client():
+    """Run the proxy app in-process with its sessions and cache directory."""
+    await standalone_proxy.create_sessions()
+    await standalone_proxy.create_cache_dir()
+    try:
+        transport = httpx.ASGITransport(app=standalone_proxy.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://testserver"
+        ) as client:
+            yield client
+    finally:
+        await standalone_proxy.remove_cache_dir()
+        await standalone_proxy.close_sessions()
+
+
+@asynccontextmanager
+async def upstream_server():
+    """Run a local upstream that redirects to an internal address."""
+
+    async def redirect_internal(request):
+        location = f"http://127.0.0.1:{request.url.port}/secret"
+        raise web.HTTPFound(location)
+
+    async def redirect_allowed(request):
+        raise web.HTTPFound("/public")
+
+    async def secret(request):
+        return web.Response(body=b"internal secret")
+
+    async def public(request):
+        return web.Response(body=b"public body", content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/redirect-internal", redirect_internal)
+    app.router.add_get("/redirect-allowed", redirect_allowed)
+    app.router.add_get("/secret", secret)
+    app.router.add_get("/public", public)
+    server = TestServer(app, host="127.0.0.1")
+    await server.start_server()
+    try:
+        yield server
+    finally:
+        await server.close()
+
+
+def general_path(url: str) -> str:
+    """Build the general proxy path for a target URL."""
+    return f"{standalone_proxy.PROXY_BASE_PATH}/general/{quote(url, safe='')}"
+
+
+class LoopbackResolver(aiohttp.abc.AbstractResolver):
+    """Resolver that maps every host name to the loopback address."""
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        return [
+            {
+                "hostname": host,
+                "host": "127.0.0.1",
+                "port": port,
+                "family": socket.AF_INET,
+                "proto": 0,
+                "flags": socket.AI_NUMERICHOST,
+            }
+        ]
+
+    async def close(self):
+        pass
+
+
+class TestTTLLFUCache:
+    """Tests for the TTL-aware LFU attachment cache."""
+
+    def test_get_returns_default_for_missing_key(self):
+        """get returns the default without raising for unknown keys."""
+        cache = TTLLFUCache(maxsize=10, ttl=60)
+        cache["a"] = 1
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("b", 2) == 2
+
+    def test_entries_expire_after_ttl(self, monkeypatch):
+        """Entries are dropped once their TTL has passed."""
+        now = time.monotonic()
+        monkeypatch.setattr(standalone_proxy.time, "monotonic", lambda: now)
+        cache = TTLLFUCache(maxsize=10, ttl=60)
+        cache["a"] = 1
+
+        monkeypatch.setattr(standalone_proxy.time, "monotonic", lambda: now + 61)
+
+        assert "a" not in cache
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_expire_after_clear(self, monkeypatch):
+        """Expiring after clear() does not fail on already removed entries."""
+        now = time.monotonic()
+        monkeypatch.setattr(standalone_proxy.time, "monotonic", lambda: now)
+        cache = TTLLFUCache(maxsize=10, ttl=60)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache.clear()
+        cache["c"] = 3
+
+        monkeypatch.setattr(standalone_proxy.time, "monotonic", lambda: now + 61)
+        cache.expire()
+
+        assert len(cache) == 0
+        assert not cache._expires
+
+    def test_size_budget_evicts_entries(self):
+        """Entries are evicted to stay within the byte budget."""
+        cache = TTLLFUCache(maxsize=10, ttl=60, getsizeof=len)
+        cache["a"] = b"123456"
+        cache["b"] = b"123456"
+
+        assert len(cache) == 1
+        assert cache.currsize <= 10
+
+
+class TestGeneralProxyHostChecks:
+    """Tests for the SSRF guard of the general proxy."""
+
+    @pytest.mark.parametrize(
+        ("hostname", "allowed"),
+        [
+            ("example.com", True),
+            ("8.8.8.8", True),
+            ("localhost", False),
+            ("127.0.0.1", False),
+            ("10.0.0.1", False),
+            ("169.254.169.254", False),
+            ("::1", False),
+        ],
+    )
+    def test_hostname_without_allowlist(self, monkeypatch, hostname, allowed):
+        """Literal internal addresses and localhost are rejected."""
+        monkeypatch.setattr(standalone_proxy, "PROXY_ALLOWED_HOSTS", frozenset())
+
+        assert _is_allowed_general_host(hostname) is allowed
+
+    def test_hostname_with_allowlist(self, monkeypatch):
+        """Only allowlisted hosts are accepted when an allowlist is set."""
+        monkeypatch.setattr(
+            standalone_proxy, "PROXY_ALLOWED_HOSTS", frozenset({"example.com"})
+        )
+
+        assert _is_allowed_general_host("example.com") is True
+        assert _is_allowed_general_host("other.example.com") is False
+
+    @pytest.mark.asyncio
+    async def test_resolver_rejects_internal_addresses(self):
+        """Names resolving only to internal addresses are refused."""
+        resolver = PublicAddressResolver()
+        resolver._resolver = AsyncMock()
+        resolver._resolver.resolve.return_value = [
+            {"hostname": "metadata.google.internal", "host": "169.254.169.254"}
+        ]
+
+        with pytest.raises(DisallowedAddressError):
+            await resolver.resolve("metadata.google.internal", 80)
+
+    @pytest.mark.asyncio
+    async def test_resolver_keeps_only_public_addresses(self):
+        """Internal addresses are dropped from mixed resolution results."""
+        resolver = PublicAddressResolver()
+        resolver._resolver = AsyncMock()
+        resolver._resolver.resolve.return_value = [
+            {"hostname": "example.com", "host": "10.0.0.5"},
+            {"hostname": "example.com", "host": "93.184.216.34"},
+        ]
+
+        addresses = await resolver.resolve("example.com", 80)
+
+        assert [addr["host"] for addr in addresses] == ["93.184.216.34"]
+
+    @pytest.mark.asyncio
+    async def test_resolver_blocks_dns_names_in_proxy(self, monkeypatch):
+        """A DNS name resolving to loopback is refused with 403."""
+        monkeypatch.setattr(standalone_proxy, "PROXY_ALLOWED_HOSTS", frozenset())
+        monkeypatch.setattr(aiohttp, "DefaultResolver", LoopbackResolver)
+
+        async with upstream_server() as server, proxy_client() as client:
+            response = await client.get(
+                general_path(f"http://internal.example.com:{server.port}/secret")
+            )
+
+        assert response.status_code == 403
+        assert b"internal secret" not in response.content
+
+    @pytest.mark.asyncio
+    async def test_redirect_to_disallowed_host_is_rejected(self, monkeypatch):
+        """Redirects are re-checked, so they cannot reach internal hosts."""
+        monkeypatch.setattr(
+            standalone_proxy, "PROXY_ALLOWED_HOSTS", frozenset({"localhost"})
+        )
+
+        async with upstream_server() as server, proxy_client() as client:
+            response = await client.get(
+                general_path(f"http://localhost:{server.port}/redirect-internal")
+            )
+
+        assert response.status_code == 403
+        assert b"internal secret" not in response.content
+
+    @pytest.mark.asyncio
+    async def test_redirect_to_allowed_host_is_followed(self, monkeypatch):
+        """Redirects that stay on allowed hosts are still followed."""
+        monkeypatch.setattr(
+            standalone_proxy, "PROXY_ALLOWED_HOSTS", frozenset({"localhost"})
+        )
+
+        async with upstream_server() as server, proxy_client() as client:
+            response = await client.get(
+                general_path(f"http://localhost:{server.port}/redirect-allowed")
+            )
+
+        assert response.status_code == 200
+        assert response.content == b"public body"
+
+
+class TestReplaceAttachmentLinks:
+    """Tests for rewriting attachment links to proxy links."""
+
+    confluence_base = "https://wiki.example.com"
+    proxy_base = "http://proxy.example.com/proxy"
+    attachments = [
+        {"id": "att1", "title": "diagram.png"},
+        {"id": "att2", "title": "spec sheet.pdf"},
+    ]
+
+    def replace(self, content):
+        return replace_attachment_links(
+            content, "123", self.proxy_base, self.confluence_base, self.attachments
+        )
+
+    def test_relative_link(self):
+        """Relative download links point at the proxy."""
+        content = '<img src="/download/attachments/123/diagram.png"/>'
+
+        assert self.replace(content) == (
+            f'<img src="{self.proxy_base}/confluence/attachment/123/att1"/>'
+        )
+
+    def test_absolute_link(self):
+        """Absolute links on the Confluence host are replaced as a whole."""
+        content = (
+            f'<a href="{self.confluence_base}/download/attachments/123/'
+            'spec%20sheet.pdf">spec</a>'
+        )
+
+        assert self.replace(content) == (
+            f'<a href="{self.proxy_base}/confluence/attachment/123/att2">spec</a>'
+        )
+
+    def test_relative_and_absolute_links_together(self):
+        """Both link forms are rewritten in the same content."""
+        content = (
+            "/download/attachments/123/diagram.png "
+            f"{self.confluence_base}/download/attachments/123/diagram.png"
+        )
+
+        proxy_link = f"{self.proxy_base}/confluence/attachment/123/att1"
+        assert self.replace(content) == f"{proxy_link} {proxy_link}"
+
+    def test_unknown_filename_is_left_unchanged(self):
+        """Links to files that are not page attachments are kept as is."""
+        content = (
+            '<img src="/download/attachments/123/missing.png"/>'
+            f'<img src="{self.confluence_base}/download/attachments/123/other.png"/>'
+        )
+
+        assert self.replace(content) == content
+
+
+class TestConfluenceAttachment:
+    """Tests for the Confluence attachment endpoint."""
+
+    @pytest.fixture
+    def confluence_upstream(self, monkeypatch, tmp_path):
+        """Point the proxy at a local upstream and reset its caches."""
+        hits = {
+            "count": 0,
+            "body": b"PNGDATA",
+            "etag": '"v1"',
+            "status": 200,
+            "delay": 0,
+        }
+
+        async def attachment(request):
+            hits["count"] += 1
+            await asyncio.sleep(hits["delay"])
+            if hits["status"] != 200:
+                return web.Response(status=hits["status"])
+            if request.headers.get("If-None-Match") == hits["etag"]:
+                return web.Response(status=304, headers={"ETag": hits["etag"]})
+            headers = {"ETag": hits["etag"]}
+            body = hits["body"]
+            if hits.get("gzip"):
+                body = gzip.compress(body)
+                headers["Content-Encoding"] = "gzip"
+            return web.Response(body=body, content_type="image/png", headers=headers)
+
+        app = web.Application()
+        app.router.add_get("/download/attachments/{page_id}/{name}", attachment)
+
+        @asynccontextmanager
+        async def start():
+            server = TestServer(app, host="127.0.0.1")
+            await server.start_server()
+            base = f"http://127.0.0.1:{server.port}"
+            monkeypatch.setattr(standalone_proxy, "_CONFLUENCE_CONFIGURED", True)
+            monkeypatch.setattr(standalone_proxy, "CACHE_DIR", tmp_path)
+            monkeypatch.setattr(
+                standalone_proxy, "_DL_PREFIX", f"{base}/download/attachments/"
+            )
+            try:
+                yield hits
+            finally:
+                await server.close()
+                standalone_proxy.cache.clear()
+                standalone_proxy.missing_cache.clear()
+
+        return start
+
+    @pytest.mark.asyncio
+    async def test_small_attachment_is_cached(self, confluence_upstream):
+        """Small attachments are read once and then served from the cache."""
+        async with confluence_upstream() as hits, proxy_client() as client:
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            first = await client.get(path)
+            second = await client.get(path)
+            not_modified = await client.get(path, headers={"If-None-Match": '"v1"'})
+
+        assert first.status_code == 200
+        assert first.content == b"PNGDATA"
+        assert first.headers["etag"] == '"v1"'
+        assert second.content == b"PNGDATA"
+        assert not_modified.status_code == 304
+        assert hits["count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_upstream_not_modified_serves_cached_body(self, confluence_upstream):
+        """An upstream 304 refreshes the stale entry and reuses its bytes."""
+        async with confluence_upstream() as hits, proxy_client() as client:
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            await client.get(path)
+            cache_key = ("1", "a.png")
+            standalone_proxy.cache[cache_key]["fetched_at"] -= (
+                standalone_proxy.ATTACHMENT_FRESH_TTL + 1
+            )
+            # Upstream would send different bytes for a full response
+            hits["body"] = b"NEWDATA"
+
+            revalidated = await client.get(path)
+            fresh = time.monotonic() - standalone_proxy.cache[cache_key]["fetched_at"]
+            cached = await client.get(path)
+
+        assert revalidated.status_code == 200
+        assert revalidated.content == b"PNGDATA"
+        assert revalidated.headers["etag"] == '"v1"'
+        assert fresh < standalone_proxy.ATTACHMENT_FRESH_TTL
+        assert cached.content == b"PNGDATA"
+        assert hits["count"] == 2
+
+    @pytest.mark.asyncio
+    async def test_grown_attachment_moves_to_disk_cache(
+        self, confluence_upstream, monkeypatch
+    ):
+        """A stale memory entry is replaced when the new body goes to disk."""
+        async with confluence_upstream() as hits, proxy_client() as client:
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            await client.get(path)
+            cache_key = ("1", "a.png")
+            assert cache_key in standalone_proxy.cache
+
+            # The entry is stale and the attachment has grown past the
+            # in-memory size limit
+            standalone_proxy.cache[cache_key]["fetched_at"] -= (
+                standalone_proxy.ATTACHMENT_FRESH_TTL + 1
+            )
+            monkeypatch.setattr(standalone_proxy, "CACHE_MAX_CONTENT_LENGTH", 16)
+            hits["body"] = b"x" * 64
+            hits["etag"] = '"v2"'
+
+            grown = await client.get(path)
+            assert grown.content == hits["body"]
+            assert cache_key not in standalone_proxy.cache
+            assert cache_key in standalone_proxy.disk_cache
+
+            cached = await client.get(path)
+
+        assert cached.content == hits["body"]
+        assert hits["count"] == 2
+
+    @pytest.mark.asyncio
+    async def test_large_attachment_streams_without_cache_dir(
+        self, confluence_upstream, monkeypatch
+    ):
+        """A missing cache directory does not truncate streamed downloads."""
+        async with confluence_upstream() as hits, proxy_client() as client:
+            monkeypatch.setattr(standalone_proxy, "CACHE_MAX_CONTENT_LENGTH", 16)
+            hits["body"] = b"x" * (3 * standalone_proxy.STREAM_CHUNK_SIZE)
+            shutil.rmtree(standalone_proxy._cache_dir)
+
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            response = await client.get(path)
+
+        assert response.status_code == 200
+        assert response.content == hits["body"]
+        assert ("1", "a.png") not in standalone_proxy.disk_cache
+
+    @pytest.mark.asyncio
+    async def test_disk_write_failure_does_not_truncate_stream(
+        self, confluence_upstream, monkeypatch, tmp_path
+    ):
+        """Write errors stop caching but the download still completes."""
+        temp_path = tmp_path / "partial.tmp"
+        temp_path.write_bytes(b"")
+
+        class FullDiskFile:
+            name = str(temp_path)
+
+            def write(self, data):
+                raise OSError(errno.ENOSPC, "No space left on device")
+
+            def flush(self):
+                pass
+
+            def close(self):
+                pass
+
+        async def open_full_disk_file():
+            return FullDiskFile()
+
+        monkeypatch.setattr(
+            standalone_proxy, "_open_disk_cache_temp_file", open_full_disk_file
+        )
+
+        async with confluence_upstream() as hits, proxy_client() as client:
+            monkeypatch.setattr(standalone_proxy, "CACHE_MAX_CONTENT_LENGTH", 16)
+            hits["body"] = b"x" * (3 * standalone_proxy.STREAM_CHUNK_SIZE)
+
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            response = await client.get(path)
+
+        assert response.content == hits["body"]
+        assert ("1", "a.png") not in standalone_proxy.disk_cache
+        assert not temp_path.exists()
+
+    @pytest.mark.asyncio
+    async def test_evicted_disk_entry_is_refetched(
+        self, confluence_upstream, monkeypatch
+    ):
+        """A disk entry whose file was removed is treated as a cache miss."""
+        async with confluence_upstream() as hits, proxy_client() as client:
+            monkeypatch.setattr(standalone_proxy, "CACHE_MAX_CONTENT_LENGTH", 16)
+            hits["body"] = b"x" * 64
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            await client.get(path)
+            cache_key = ("1", "a.png")
+            standalone_proxy.disk_cache[cache_key]["path"].unlink()
+
+            refetched = await client.get(path)
+
+            # A stale entry revalidated with 304 also falls back to a full fetch
+            standalone_proxy.disk_cache[cache_key]["path"].unlink()
+            standalone_proxy.disk_cache[cache_key]["fetched_at"] -= (
+                standalone_proxy.ATTACHMENT_FRESH_TTL + 1
+            )
+            revalidated = await client.get(path)
+            cached = await client.get(path)
+
+        assert refetched.status_code == 200
+        assert refetched.content == hits["body"]
+        assert revalidated.status_code == 200
+        assert revalidated.content == hits["body"]
+        assert cached.content == hits["body"]
+        assert hits["count"] == 4
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize(("status", "body"), [(200, b"PNGDATA"), (500, None)])
+    async def test_concurrent_requests_share_one_fetch(
+        self, confluence_upstream, status, body
+    ):
+        """Concurrent requests for one attachment wait for a single fetch."""
+        async with confluence_upstream() as hits, proxy_client() as client:
+            hits["status"] = status
+            hits["delay"] = 0.1
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            responses = await asyncio.gather(*(client.get(path) for _ in range(5)))
+
+        assert [response.status_code for response in responses] == [status] * 5
+        if body is not None:
+            assert all(response.content == body for response in responses)
+        assert hits["count"] == 1
+        assert not standalone_proxy._INFLIGHT
+
+    @pytest.mark.asyncio
+    async def test_missing_attachment_is_cached_until_ttl(
+        self, confluence_upstream, monkeypatch
+    ):
+        """A 404 is answered from the negative cache until it expires."""
+        now = time.monotonic()
+        monkeypatch.setattr(standalone_proxy.time, "monotonic", lambda: now)
+        monkeypatch.setattr(
+            standalone_proxy,
+            "missing_cache",
+            TTLCache(maxsize=10, ttl=60, timer=lambda: now),
+        )
+
+        async with confluence_upstream() as hits, proxy_client() as client:
+            hits["status"] = 404
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            first = await client.get(path)
+            cached = await client.get(path)
+            assert hits["count"] == 1
+
+            now += 61
+            refetched = await client.get(path)
+
+        assert first.status_code == 404
+        assert cached.status_code == 404
+        assert refetched.status_code == 404
+        assert hits["count"] == 2
+
+    @pytest.mark.asyncio
+    async def test_declared_length_over_max_body_is_rejected(
+        self, confluence_upstream, monkeypatch
+    ):
+        """A Content-Length above MAX_BODY is rejected before reading."""
+        monkeypatch.setattr(standalone_proxy, "MAX_BODY", 32)
+
+        async with confluence_upstream() as hits, proxy_client() as client:
+            hits["body"] = b"x" * 64
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            response = await client.get(path)
+
+        assert response.status_code == 413
+        assert ("1", "a.png") not in standalone_proxy.cache
+        assert ("1", "a.png") not in standalone_proxy.disk_cache
+
+    @pytest.mark.asyncio
+    async def test_decoded_body_over_max_body_is_rejected(
+        self, confluence_upstream, monkeypatch
+    ):
+        """A body that exceeds MAX_BODY only after decoding is rejected."""
+        monkeypatch.setattr(standalone_proxy, "MAX_BODY", 256)
+
+        async with confluence_upstream() as hits, proxy_client() as client:
+            # The compressed Content-Length is below the limit
+            hits["body"] = b"x" * 4096
+            hits["gzip"] = True
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/attachment/1/a.png"
+            response = await client.get(path)
+
+        assert response.status_code == 413
+        assert ("1", "a.png") not in standalone_proxy.cache
+        assert ("1", "a.png") not in standalone_proxy.disk_cache
+
+
+class TestConfluencePage:
+    """Tests for the page endpoint and its version-checked cache."""
+
+    @pytest.fixture
+    def page_upstream(self, monkeypatch):
+        """Serve Confluence pages from a local upstream and reset the cache."""
+        hits = {"page": 0, "version": 0, "number": 1}
+
+        async def content(request):
+            if request.query.get("expand") == "version":
+                hits["version"] += 1
+            else:
+                hits["page"] += 1
+            page_id = request.match_info["page_id"]
+            storage = f'<img src="/download/attachments/{page_id}/a.png"/>'
+            if hits.get("chunked"):
+                # Chunked encoding sends no Content-Length
+                response = web.StreamResponse()
+                response.enable_chunked_encoding()
+                await response.prepare(request)
+                await response.write(b'{"body": "' + b"x" * 1024 + b'"}')
+                await response.write_eof()
+                return response
+            return web.json_response(
+                {
+                    "id": page_id,
+                    "title": f"Page {page_id}",
+                    "type": "page",
+                    "version": {"number": hits["number"]},
+                    "body": {"storage": {"value": storage}},
+                    "children": {
+                        "attachment": {"results": [{"id": "att1", "title": "a.png"}]}
+                    },
+                }
+            )
+
+        app = web.Application()
+        app.router.add_get("/rest/api/content/{page_id}", content)
+
+        @asynccontextmanager
+        async def start():
+            server = TestServer(app, host="127.0.0.1")
+            await server.start_server()
+            base = f"http://127.0.0.1:{server.port}"
+            monkeypatch.setattr(standalone_proxy, "_CONFLUENCE_CONFIGURED", True)
+            monkeypatch.setattr(
+                standalone_proxy, "_CONTENT_API_PREFIX", f"{base}/rest/api/content/"
+            )
+            try:
+                yield hits
+            finally:
+                await server.close()
+                standalone_proxy.page_cache.clear()
+
+        return start
+
+    @pytest.mark.asyncio
+    async def test_unchanged_version_is_served_from_cache(self, page_upstream):
+        """Only the version is fetched again while the page is unchanged."""
+        async with page_upstream() as hits, proxy_client() as client:
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/page/1"
+            first = await client.get(path)
+            second = await client.get(path)
+
+        assert first.status_code == 200
+        assert second.content == first.content
+        assert "/confluence/attachment/1/att1" in first.json()["content"]
+        assert hits["page"] == 1
+        assert hits["version"] == 1
+
+    @pytest.mark.asyncio
+    async def test_version_bump_refetches_page(self, page_upstream):
+        """A new page version replaces the cached page."""
+        async with page_upstream() as hits, proxy_client() as client:
+            path = f"{standalone_proxy.PROXY_BASE_PATH}/confluence/page/1"
+            await client.get(path)
+            hits["number"] = 2
+            updated = await client.get(path)
+            cached = await client.get(path)
+
+        assert updated.json()["version"] == {"number": 2}
+        assert cached.content == updated.content
+        assert hits["page"] == 2
+        assert hits["version"] == 2
+
+    @pytest.mark.asyncio
+    async def test_page_cache_is_bounded(self, page_upstream, monkeypatch):
+        """Older pages are evicted once the cache is full."""
+        monkeypatch.setattr(standalone_proxy, "page_cache", TTLCache(maxsize=2, ttl=60))
+
+        async with page_upstream(), proxy_client() as client:
+            for page_id in range(5):
+                await client.get(
+                    f"{standalone_proxy.PROXY_BASE_PATH}/confluence/page/{page_id}"
+                )
+                assert len(standalone_proxy.page_cache) <= 2
+
+            assert len(standalone_proxy.page_cache) == 2
+
+    @pytest.mark.asyncio
+    async def test_chunked_page_over_max_body_is_rejected(
+        self, page_upstream, monkeypatch
+    ):
+        """A page without Content-Length is rejected once it exceeds MAX_BODY."""
+        monkeypatch.setattr(standalone_proxy, "MAX_BODY", 256)
+
+        async with page_upstream() as hits, proxy_client() as client:
+            hits["chunked"] = True
+            response = await client.get(
+                f"{standalone_proxy.PROXY_BASE_PATH}/confluence/page/1"
+            )
+            assert not standalone_proxy.page_cache
+
+        assert response.status_code == 413